@@ -0,0 +1,230 @@
+#! /usr/bin/env python3
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import limitlessled_rf
+import limitlessled_rf.color
+import limitlessled_rf.simulator
+
+def measure_rate(function, minimum_time = 0.5):
+	# Call the function repeatedly for at least "minimum_time" seconds
+	# and return the number of calls per second
+	calls = 0
+	batch = 1
+	start = time.perf_counter()
+	while True:
+		for call in range(batch):
+			function()
+		calls += batch
+
+		elapsed = time.perf_counter() - start
+		if elapsed >= minimum_time:
+			return calls / elapsed
+
+		batch *= 2
+
+def sample_buttons(remote, count = 256):
+	# A mix of button presses valid for this remote type
+	buttons = []
+	for button_name in remote._config['button_map']:
+		button_info = {'button': button_name.split(':')[0]}
+		if button_name.find(':') != -1:
+			button_info['zone'] = int(button_name.split(':')[1])
+		if button_info['button'] == 'zone_set_brightness':
+			button_info['brightness'] = 12
+			button_info['zone'] = 2
+		if button_info['button'] == 'zone_set_color':
+			button_info['color'] = 0x80
+			button_info['zone'] = 3
+		if button_info['button'] in ['set_brightness', 'set_color', 'set_temperature', 'set_saturation']:
+			button_info.update({'brightness': 50, 'color': 0x80, 'temperature': 50, 'saturation': 50})
+		buttons.append(button_info)
+
+	samples = []
+	for index in range(count):
+		button_info = dict(buttons[index % len(buttons)])
+		button_info['remote_id'] = remote.get_id()
+		button_info['message_id'] = index & 0xff
+		samples.append(button_info)
+
+	return samples
+
+def benchmark_codecs(results, minimum_time):
+	for remote_type in ['rgbw', 'cct', 'lyh_cct', 'rgbcct']:
+		remote = limitlessled_rf.Remote(None, remote_type, 0x51F0)
+		samples = sample_buttons(remote)
+		if remote_type == 'lyh_cct':
+			# Not every button (or zone 4) has a known code
+			samples = [sample for sample in samples if remote._encode_button_message(dict(sample)) is not None]
+
+		def encode():
+			for sample in samples:
+				remote._encode_button_message(dict(sample))
+
+		frames = [remote._encode_button_message(dict(sample)) for sample in samples]
+
+		def decode():
+			for frame in frames:
+				remote._decode_button_message(frame)
+
+		results['encode_{}'.format(remote_type)] = {
+			'value': measure_rate(encode, minimum_time) * len(samples),
+			'unit':   'frames/s',
+			'better': 'higher'
+		}
+		results['decode_{}'.format(remote_type)] = {
+			'value': measure_rate(decode, minimum_time) * len(frames),
+			'unit':   'frames/s',
+			'better': 'higher'
+		}
+
+	return None
+
+def benchmark_color(results, minimum_time):
+	remote = limitlessled_rf.Remote(None, 'rgbw', 0x51F0)
+	generator = random.Random(0)
+	rgb_values = [generator.randint(0, 0xffffff) for index in range(1024)]
+
+	def convert():
+		for rgb in rgb_values:
+			remote._rgb_to_color(rgb)
+
+	def convert_batch():
+		limitlessled_rf.color.rgb_to_color_batch(rgb_values)
+
+	results['rgb_to_color'] = {
+		'value': measure_rate(convert, minimum_time) * len(rgb_values),
+		'unit':   'conversions/s',
+		'better': 'higher'
+	}
+	results['rgb_to_color_batch'] = {
+		'value': measure_rate(convert_batch, minimum_time) * len(rgb_values),
+		'unit':   'conversions/s',
+		'better': 'higher'
+	}
+
+	return None
+
+def simulate(remote_type, calls, config = None):
+	# Run a sequence of calls against a simulated radio and return the
+	# presses sent and airtime used by the last call
+	radio = limitlessled_rf.simulator.SimulatedRadio()
+	remote_config = radio.remote_config()
+	if config is not None:
+		remote_config.update(config)
+
+	remote = limitlessled_rf.Remote(radio, remote_type, 0x51F0, message_id = 0, config = remote_config)
+	for method, args in calls[:-1]:
+		getattr(remote, method)(*args)
+
+	radio.reset_stats()
+	method, args = calls[-1]
+	getattr(remote, method)(*args)
+
+	return radio.get_stats()
+
+def add_airtime_results(results, name, stats):
+	results['{}_presses'.format(name)] = {
+		'value': stats['presses'],
+		'unit':   'presses',
+		'better': 'lower'
+	}
+	results['{}_airtime'.format(name)] = {
+		'value': stats['airtime'],
+		'unit':   's',
+		'better': 'lower'
+	}
+
+	return None
+
+def benchmark_airtime(results):
+	# Set brightness from every starting level to every other level,
+	# both with and without state tracking
+	brightness_range = limitlessled_rf.Remote(None, 'cct', 0x51F0)._config['brightness_range']
+	levels = list(range(brightness_range[0], brightness_range[1] + 1))
+	levels = [int(((level - brightness_range[0]) * 254 / (brightness_range[1] - brightness_range[0])) + 1) for level in levels]
+
+	for mode, config in [('untracked', None), ('tracked', {'track_state': True})]:
+		total = {'presses': 0, 'airtime': 0.0}
+		for start in levels:
+			for target in levels:
+				stats = simulate('cct', [('set_brightness', (start, 1)), ('set_brightness', (target, 1))], config)
+				total['presses'] += stats['presses']
+				total['airtime'] += stats['airtime']
+
+		add_airtime_results(results, 'cct_set_brightness_all_levels_{}'.format(mode), total)
+
+	add_airtime_results(results, 'cct_on', simulate('cct', [('on', (1,))]))
+	add_airtime_results(results, 'cct_off_dim', simulate('cct', [('off', (1,))]))
+	add_airtime_results(results, 'cct_unpair', simulate('cct', [('unpair', (1,))]))
+	add_airtime_results(results, 'cct_set_temperature', simulate('cct', [('set_temperature', (4000, 1))]))
+	add_airtime_results(results, 'rgbw_on', simulate('rgbw', [('on', (1,))]))
+	add_airtime_results(results, 'rgbw_off_dim', simulate('rgbw', [('off', (1,))]))
+	add_airtime_results(results, 'rgbw_unpair', simulate('rgbw', [('unpair', (1,))]))
+	add_airtime_results(results, 'rgbw_set_color', simulate('rgbw', [('set_color', (0xff0000, 1))]))
+	add_airtime_results(results, 'lyh_cct_set_brightness', simulate('lyh_cct', [('set_brightness', (128, None))]))
+
+	return None
+
+def compare(results, baseline, tolerance):
+	# Return the list of results which are worse than the baseline by
+	# more than the tolerance (a fraction of the baseline)
+	regressions = []
+	for name, result in sorted(results.items()):
+		if name not in baseline:
+			continue
+
+		baseline_value = baseline[name]['value']
+		value = result['value']
+		if result['better'] == 'higher':
+			regressed = value < baseline_value * (1 - tolerance)
+		else:
+			regressed = value > baseline_value * (1 + tolerance)
+
+		if regressed:
+			regressions.append((name, baseline_value, value, result['unit']))
+
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description = 'Benchmark limitlessled_rf encoding, decoding and airtime')
+	parser.add_argument('--output', default = None, help = 'file to write the results to, as JSON')
+	parser.add_argument('--baseline', default = None, help = 'JSON results file to compare against')
+	parser.add_argument('--tolerance', type = float, default = 0.10, help = 'allowed regression, as a fraction of the baseline')
+	parser.add_argument('--time', type = float, default = 0.5, help = 'minimum time to run each throughput benchmark for')
+	args = parser.parse_args()
+
+	results = {}
+	benchmark_codecs(results, args.time)
+	benchmark_color(results, args.time)
+	benchmark_airtime(results)
+
+	for name, result in sorted(results.items()):
+		print("{:<55} {:>16.2f} {}".format(name, result['value'], result['unit']))
+
+	if args.output is not None:
+		with open(args.output, 'w') as output:
+			json.dump({'results': results}, output, indent = 1, sort_keys = True)
+
+	if args.baseline is not None:
+		with open(args.baseline, 'r') as baseline_file:
+			baseline = json.load(baseline_file)['results']
+
+		regressions = compare(results, baseline, args.tolerance)
+		for name, baseline_value, value, unit in regressions:
+			print("REGRESSION: {}: {:.2f} -> {:.2f} {}".format(name, baseline_value, value, unit))
+
+		if len(regressions) != 0:
+			return 1
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
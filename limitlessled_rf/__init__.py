@@ -1,11 +1,487 @@
 #! /usr/bin/env python3
 
+import collections
+import functools
 import random
+import threading
 import time
+import types
+
+from . import color
+from . import receiver
+
+def _instrumented(name):
+	# Trace calls to a public method as a span, if the remote has
+	# metrics enabled -- otherwise call straight through
+	def decorator(method):
+		@functools.wraps(method)
+		def wrapper(self, *args, **kwargs):
+			metrics = self._metrics
+			if metrics is None:
+				return method(self, *args, **kwargs)
+
+			with metrics.span(name, remote_type = self._type, remote_id = self._id):
+				return method(self, *args, **kwargs)
+
+		return wrapper
+
+	return decorator
+
+class _PressRecorder:
+	# Stands in for a radio, recording the presses a remote would
+	# transmit and the pauses between them instead of performing them.
+	# A virtual clock advances by the airtime of each press and each
+	# pause, so that the remote sees time pass as it would when they
+	# are performed.
+	def __init__(self, start_time = 0.0):
+		self.presses = []
+		self.time = start_time
+		return None
+
+	def multi_transmit(self, message, channels, retries, delay, press_info = None, **kwargs):
+		# "press_info" is kept with the press for accounting for it once
+		# it is transmitted (see "Remote._transmit")
+		self.presses.append(('transmit', (message, channels, retries, delay), kwargs, press_info))
+		self.time += retries * delay
+		return True
+
+	def sleep(self, seconds):
+		self.presses.append(('sleep', seconds))
+		self.time += seconds
+		return None
+
+class ButtonEvent:
+	# A button press, either to send or as decoded from a frame.  It
+	# uses slots rather than a dictionary to keep allocation small, but
+	# can be used like the dictionaries previously used for presses:
+	# fields which are None are treated as absent.
+	__slots__ = ('button', 'zone', 'remote_id', 'message_id', 'color', 'brightness', 'temperature', 'saturation', 'retries', 'delay', 'raw', 'remote_type', 'channel', 'timestamp', 'copies')
+
+	def __init__(self, button = None, zone = None, remote_id = None, message_id = None, color = None, brightness = None, temperature = None, saturation = None, retries = None, delay = None, raw = None, remote_type = None, channel = None, timestamp = None, copies = None):
+		self.button = button
+		self.zone = zone
+		self.remote_id = remote_id
+		self.message_id = message_id
+		self.color = color
+		self.brightness = brightness
+		self.temperature = temperature
+		self.saturation = saturation
+		self.retries = retries
+		self.delay = delay
+		self.raw = raw
+		self.remote_type = remote_type
+		self.channel = channel
+		self.timestamp = timestamp
+		self.copies = copies
+		return None
+
+	@classmethod
+	def from_dict(cls, button_info):
+		if isinstance(button_info, cls):
+			return button_info.copy()
+
+		# Keys which are not fields are ignored, as they were when
+		# buttons were plain dictionaries
+		return cls(**{key: value for key, value in button_info.items() if key in cls.__slots__})
+
+	def copy(self):
+		event = ButtonEvent.__new__(ButtonEvent)
+		for field in self.__slots__:
+			setattr(event, field, getattr(self, field))
+		return event
+
+	def to_dict(self):
+		return dict(self.items())
+
+	def __getitem__(self, key):
+		try:
+			value = getattr(self, key)
+		except (AttributeError, TypeError):
+			raise KeyError(key)
+
+		if value is None:
+			raise KeyError(key)
+
+		return value
+
+	def __setitem__(self, key, value):
+		if key not in self.__slots__:
+			raise KeyError(key)
+
+		setattr(self, key, value)
+		return None
+
+	def __delitem__(self, key):
+		if key not in self.__slots__:
+			raise KeyError(key)
+
+		setattr(self, key, None)
+		return None
+
+	def __contains__(self, key):
+		return key in self.__slots__ and getattr(self, key) is not None
+
+	def get(self, key, default = None):
+		value = getattr(self, key, None)
+		if value is None:
+			return default
+
+		return value
+
+	def update(self, button_info):
+		for key, value in button_info.items():
+			self[key] = value
+		return None
+
+	def keys(self):
+		return [field for field in self.__slots__ if getattr(self, field) is not None]
+
+	def items(self):
+		return [(field, getattr(self, field)) for field in self.__slots__ if getattr(self, field) is not None]
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.keys())
+
+	def __eq__(self, other):
+		if isinstance(other, (ButtonEvent, dict)):
+			return self.to_dict() == dict(other.items())
+
+		return NotImplemented
+
+	def __repr__(self):
+		return repr(self.to_dict())
+
+class _ButtonCodec:
+	# A codec compiled once per remote type: every button and zone has
+	# a precomputed frame template, so that encoding only needs to patch
+	# in the variable bytes (including the remote ID), and decoding maps
+	# button IDs through a table instead of searching the button map
+	def __init__(self, remote_type, config, compute_button_message):
+		self._templates = {}
+
+		# Table of button ID to (button name, zone)
+		self._buttons = []
+		for button_id in range(256):
+			self._buttons.append(('unknown=' + str(button_id), None))
+
+		for button_name, button_id in config['button_map'].items():
+			zone = None
+			if button_name.find(':') != -1:
+				button_name_zone = button_name.split(':')
+				button_name = button_name_zone[0]
+				zone = int(button_name_zone[1])
+
+			self._buttons[button_id] = (button_name, zone)
+
+		getattr(self, '_compile_' + remote_type)(config, compute_button_message)
+
+		self.encode = getattr(self, '_encode_' + remote_type)
+		self.decode = getattr(self, '_decode_' + remote_type)
+
+		return None
+
+	def _compile_templates(self, config, compute_button_message, button_names, kinds):
+		zones = [None] + list(config.get('zones', [1, 2, 3, 4]))
+		for button_name in button_names:
+			kind = kinds.get(button_name, None)
+			for zone in zones:
+				button_info = {
+					'button': button_name,
+					'remote_id': 0,
+					'message_id': 0,
+					'brightness': 0,
+					'color': 0
+				}
+				if zone is not None:
+					button_info['zone'] = zone
+
+				# Not every button can be sent to every zone
+				try:
+					template = compute_button_message(button_info)
+				except KeyError:
+					continue
+
+				self._templates[(button_name, zone)] = (bytes(template), kind)
+
+		return None
+
+	def lookup_button_id(self, button_id):
+		return self._buttons[button_id]
+
+	def _compile_rgbw(self, config, compute_button_message):
+		button_names = set([button_name.split(':')[0] for button_name in config['button_map']])
+		button_names.update(['set_color', 'set_brightness'])
+
+		self._compile_templates(config, compute_button_message, button_names, {
+			'set_color':           'color',
+			'zone_set_color':      'color',
+			'set_brightness':      'brightness',
+			'zone_set_brightness': 'brightness'
+		})
+
+		# Brightness is a range of [0..25] (26 steps), shifted 3 bits left
+		self._brightness_encode = {}
+		for brightness in range(26):
+			self._brightness_encode[brightness] = (31 - ((brightness + 15) % 32)) << 3
+
+		self._brightness_decode = []
+		for brightness in range(32):
+			self._brightness_decode.append(31 - ((brightness + 15) % 32))
+
+		return None
+
+	def _encode_rgbw(self, button_info):
+		template = self._templates.get((button_info['button'], button_info.get('zone')))
+		if template is None:
+			return None
+
+		template, kind = template
+		remote_id = button_info['remote_id']
+		message = bytearray(template)
+		message[1] = (remote_id >> 8) & 0xff
+		message[2] = remote_id & 0xff
+		message[6] = button_info['message_id']
+
+		if kind == 'color':
+			message[3] = button_info['color']
+		elif kind == 'brightness':
+			brightness = button_info['brightness']
+			if brightness < 0:
+				brightness = 0
+			elif brightness > 25:
+				brightness = 25
+
+			brightness = self._brightness_encode.get(brightness)
+			if brightness is None:
+				return None
+
+			message[4] = brightness | (template[4] & 0b111)
+
+		return message
+
+	def _decode_rgbw(self, button_message):
+		# Verify the header -- if it is not valid, return None
+		if button_message[0] != 0xB0:
+			return None
+
+		button_name, zone = self._buttons[button_message[5]]
+
+		button_info = ButtonEvent(
+			remote_id = (button_message[1] << 8) | button_message[2],
+			color = button_message[3],
+			brightness = button_message[4],
+			message_id = button_message[6],
+			button = button_name,
+			zone = zone
+		)
+
+		if button_name == 'zone_set_brightness':
+			zone = button_message[4] & 0b111
+			if zone != 0:
+				button_info.zone = zone
+			else:
+				button_info.button = 'set_brightness'
+
+			button_info.brightness = self._brightness_decode[button_message[4] >> 3]
+
+		return button_info
+
+	def _compile_cct(self, config, compute_button_message):
+		button_names = set([button_name.split(':')[0] for button_name in config['button_map']])
+
+		self._compile_templates(config, compute_button_message, button_names, {})
+
+		return None
+
+	def _encode_cct(self, button_info):
+		template = self._templates.get((button_info['button'], button_info.get('zone')))
+		if template is None:
+			return None
+
+		# The template was computed with a remote ID and message ID of
+		# 0, so they only need to be added to the CRC
+		template = template[0]
+		remote_id = button_info['remote_id']
+		message_id = button_info['message_id']
+
+		message = bytearray(template)
+		message[1] = (remote_id >> 8) & 0xff
+		message[2] = remote_id & 0xff
+		message[5] = message_id
+		message[6] = (template[6] + message[1] + message[2] + message_id) & 0xff
+
+		return message
+
+	def _decode_cct(self, button_message):
+		# Verify the header -- if it is not valid, return None
+		if button_message[0] != 0x5A:
+			return None
+
+		button_name, zone = self._buttons[button_message[4]]
+
+		# Remove the all zone
+		if zone is None and button_message[3] != 0:
+			zone = button_message[3]
+
+		return ButtonEvent(
+			remote_id = (button_message[1] << 8) | button_message[2],
+			message_id = button_message[5],
+			button = button_name,
+			zone = zone
+		)
+
+# Scrambling used by the second generation ("V2") protocols, in which
+# each byte after the first (a key) is XORed and offset depending on the
+# key and its position
+_v2_offsets = [
+	[0x45, 0x1F, 0x14, 0x5C], # Protocol ID
+	[0x2B, 0xC9, 0xE3, 0x11], # Remote ID (high)
+	[0x6D, 0x5F, 0x8A, 0x2B], # Remote ID (low)
+	[0xAF, 0x03, 0x1D, 0xF3], # Command
+	[0x1A, 0xE2, 0xF0, 0xD1], # Argument
+	[0x04, 0xD8, 0x71, 0x42], # Message ID
+	[0xAF, 0x04, 0xDD, 0x07], # Zone
+	[0x61, 0x13, 0x38, 0x64]  # Checksum
+]
+_v2_offset_jump_start = 0x54
+
+def _v2_xor_key(key):
+	# Most significant nibble
+	shift = 0
+	if (key & 0x0F) >= 0x04:
+		shift = 1
+	x = (((key & 0xF0) >> 4) + shift + 6) % 8
+	msn = (((4 + x) ^ 1) & 0x0F) << 4
+
+	# Least significant nibble
+	lsn = (((key & 0x0F) + 4) ^ 2) & 0x0F
+
+	return msn | lsn
+
+def _v2_offset(index, key, jump_start):
+	offset = _v2_offsets[index - 1][key % 4]
+	if jump_start > 0 and key >= jump_start and key < (jump_start + 0x80):
+		offset += 0x80
+
+	return offset
+
+def _v2_scramble(packet):
+	key = packet[0]
+	xor_key = _v2_xor_key(key)
+
+	message = bytearray(packet)
+	checksum = key
+	for index in range(1, 8):
+		checksum += packet[index]
+		message[index] = ((packet[index] ^ xor_key) + _v2_offset(index, key, _v2_offset_jump_start)) & 0xff
+
+	message[8] = ((((checksum + 2) & 0xff) ^ xor_key) + _v2_offset(8, key, 0)) & 0xff
+
+	return message
+
+def _v2_unscramble(message):
+	# Returns None if the checksum does not match
+	key = message[0]
+	xor_key = _v2_xor_key(key)
+
+	packet = bytearray(message[0:9])
+	checksum = key
+	for index in range(1, 8):
+		packet[index] = ((message[index] - _v2_offset(index, key, _v2_offset_jump_start)) & 0xff) ^ xor_key
+		checksum += packet[index]
+
+	packet[8] = ((((message[8] - _v2_offset(8, key, 0)) & 0xff) ^ xor_key) - 2) & 0xff
+	if packet[8] != (checksum & 0xff):
+		return None
+
+	return packet
+
+def _crc16_kermit(data):
+	# CRC-16/KERMIT (reflected polynomial 0x1021, no initial value or
+	# final XOR), as used by the "lyh_cct" protocol
+	crc = 0
+	for byte in data:
+		crc ^= byte
+		for bit in range(8):
+			if crc & 1:
+				crc = (crc >> 1) ^ 0x8408
+			else:
+				crc = crc >> 1
+
+	return crc
+
+# "lyh_cct" frames carry each field one bit late: bit 7 of a byte is the
+# lowest bit of the field in the following byte
+def _lyh_cct_encode(button_code, zone_mask, sequence):
+	frame = bytearray([
+		0x05 | ((button_code & 1) << 7),
+		0x80 | (button_code >> 1),
+		0x80,
+		0x88,
+		0x91,
+		0x31 | ((zone_mask & 1) << 7),
+		zone_mask >> 1,
+		(sequence & 1) << 7,
+		sequence >> 1,
+		0x00,
+		0x00
+	])
+
+	# Bytes 9 and 10 (but for its top bit) are a 16-bit little endian
+	# sum of bytes 0, 5 and 7 and, shifted up a byte, 1, 6 and 8
+	check = (frame[0] + frame[5] + frame[7]) + ((frame[1] + frame[6] + frame[8]) << 8) + 0x4BCB
+	frame[9] = check & 0xff
+	frame[10] = (check >> 8) & 0x7f
+
+	# The top bit of byte 10 is the parity of bits 2, 5 and 6 of the
+	# CRC's low byte, which setting it does not change
+	crc = _crc16_kermit(frame)
+	if bin(crc & 0x64).count('1') & 1:
+		frame[10] |= 0x80
+		crc = _crc16_kermit(frame)
+
+	frame.append(crc & 0xff)
+	frame.append(crc >> 8)
+
+	return frame
+
+def _lyh_cct_decode(frame):
+	# Returns the button code, zone mask and sequence number, or None
+	# if the frame is not one which would have been sent
+	if len(frame) < 13:
+		return None
+
+	button_code = ((frame[1] & 0x7f) << 1) | (frame[0] >> 7)
+	zone_mask = ((frame[6] & 0x7f) << 1) | (frame[5] >> 7)
+	sequence = ((frame[8] & 0x7f) << 1) | (frame[7] >> 7)
+
+	if _lyh_cct_encode(button_code, zone_mask, sequence) != frame[0:13]:
+		return None
+
+	return button_code, zone_mask, sequence
+
+class _Protocol:
+	# The definition of a remote type, compiled once and shared by every
+	# remote of that type: its (read-only) parameters and the functions
+	# implementing it
+	def __init__(self, remote_type, parameters, compute_button_message, parse_button_message, pair, unpair):
+		self.name = remote_type
+		self.parameters = parameters
+		self.compute_button_message = compute_button_message
+		self.parse_button_message = parse_button_message
+		self.pair = pair
+		self.unpair = unpair
+
+		# Compiled by the first remote using the protocol
+		self.codec = None
+
+		return None
 
 class Remote:
 	_remote_type_alias_map = {
-		'fut089': 'rgbcct'
 	}
 	_remote_type_parameters_map = {
 		'rgbw': {
@@ -95,8 +571,8 @@ class Remote:
 			}
 		},
 		'lyh_cct': {
-			'retries':  70,
-			'delay':    0.2,
+			'retries':  10,
+			'delay':    0.1,
 			'channels': [24],
 			'syncword': [0x6F67, 0xA118],
 			'message_length': 13,
@@ -141,13 +617,40 @@ class Remote:
 				'temperature_up':   0x0E,
 				'temperature_down': 0x0F
 			}
+		},
+		'rgbcct': {
+			'retries':  10,
+			'delay':    0.1,
+			'channels': [8, 39, 70],
+			'syncword': [0x1809, 0x7236],
+			'protocol_id': 0x20,
+			'zones': [1, 2, 3, 4],
+			'features': [
+				'can_set_brightness',
+				'can_set_temperature',
+				'has_brightness',
+				'has_temperature',
+				'has_white',
+				'has_night',
+				'has_color'
+			],
+			'brightness_range': [0, 100],
+			'temperature_output_range': [0, 100],
+			'temperature_input_range':  [6500, 2700],
+			'color_offset': 0x5F,
+			'button_map': {
+				'on':              0x01,
+				'off':             0x01,
+				'night':           0x81,
+				'set_color':       0x02,
+				'set_temperature': 0x03,
+				'set_brightness':  0x04,
+				'set_saturation':  0x04,
+				'mode':            0x05
+			}
 		}
 	}
 	_remote_type_parameters_map_unimplemented = {
-		'rgbcct': {
-			'channels': [8, 39, 70],
-			'syncword': [0x1809, 0x7236]
-		},
 		'rgb': {
 			'channels': [3, 38, 73],
 			'syncword': [0xBCCD, 0x9AAB]
@@ -157,19 +660,100 @@ class Remote:
 			'syncword': [0xAA55, 0x50A0]
 		}
 	}
+	# Frames captured from a real "lyh_cct" remote, by button and zone,
+	# which the encoder reproduces exactly (see "_lyh_cct_encode" and
+	# "tools/lyh_cct_solver.py")
+	_lyh_cct_frames = {
+		('on', None): [
+			bytes([0x85, 0xb7, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x66, 0x01, 0x59, 0xad, 0x07]),
+			# Captured as "max", but with the same button code as "on"
+			bytes([0x85, 0xb7, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x80, 0x66, 0x81, 0xd9, 0x07, 0x22])
+		],
+		('on', 1): [
+			bytes([0x85, 0xb7, 0x80, 0x88, 0x91, 0xb1, 0x68, 0x00, 0x67, 0x01, 0xd3, 0xff, 0x46])
+		],
+		('on', 2): [
+			bytes([0x85, 0xb7, 0x80, 0x88, 0x91, 0x31, 0x69, 0x80, 0x67, 0x01, 0xd4, 0xc8, 0x11])
+		],
+		('on', 3): [
+			bytes([0x85, 0xb7, 0x80, 0x88, 0x91, 0x31, 0x6a, 0x00, 0x68, 0x81, 0x55, 0xe0, 0x72])
+		],
+		('off', None): [
+			bytes([0x05, 0xb0, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x80, 0x66, 0x01, 0xd2, 0xf6, 0x46])
+		],
+		('off', 1): [
+			bytes([0x05, 0xb0, 0x80, 0x88, 0x91, 0xb1, 0x68, 0x80, 0x68, 0x01, 0x4d, 0x4f, 0x0a])
+		],
+		('off', 2): [
+			bytes([0x05, 0xb0, 0x80, 0x88, 0x91, 0x31, 0x69, 0x00, 0x69, 0x01, 0x4e, 0x80, 0x41])
+		],
+		('off', 3): [
+			bytes([0x05, 0xb0, 0x80, 0x88, 0x91, 0x31, 0x6a, 0x80, 0x69, 0x81, 0xcf, 0x6f, 0x68])
+		],
+		('brightness_up', None): [
+			bytes([0x05, 0xb3, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x39, 0x81, 0xa7, 0x33, 0x7e]),
+			bytes([0x05, 0xb3, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x3c, 0x81, 0x2a, 0x63, 0x18])
+		],
+		('brightness_down', None): [
+			bytes([0x85, 0xb2, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x3d, 0x01, 0x2b, 0xc6, 0x61]),
+			bytes([0x85, 0xb2, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x45, 0x01, 0xb3, 0x1d, 0x3f])
+		],
+		('temperature_up', None): [
+			bytes([0x85, 0xb4, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x4b, 0x01, 0xbb, 0x9c, 0x4b]),
+			bytes([0x85, 0xb4, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x80, 0x4e, 0x81, 0x3e, 0x26, 0x00])
+		],
+		('temperature_down', None): [
+			bytes([0x05, 0xb5, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x80, 0x46, 0x01, 0x37, 0xd5, 0x69]),
+			bytes([0x05, 0xb5, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x80, 0x4a, 0x01, 0x3b, 0x1a, 0x06])
+		]
+	}
+
+	# Button name -> code; no code is known for "max" or "night"
+	_lyh_cct_button_codes = {
+		'off':              0x60,
+		'brightness_down':  0x65,
+		'brightness_up':    0x66,
+		'temperature_up':   0x69,
+		'temperature_down': 0x6A,
+		'on':               0x6F
+	}
+	_lyh_cct_button_names = {code: name for name, code in _lyh_cct_button_codes.items()}
+
+	# Each zone has a bit of the zone mask, all of them for all zones
+	_lyh_cct_zone_mask_base = 0xD0
+	_lyh_cct_zone_mask_all = 0x0F
+
+	_protocols = {}
+	_easing_functions = {
+		'linear':      lambda t: t,
+		'ease_in':     lambda t: t * t,
+		'ease_out':    lambda t: 1 - ((1 - t) * (1 - t)),
+		'ease_in_out': lambda t: t * t * (3 - (2 * t))
+	}
 
 	def __init__(self, radio, remote_type, remote_id, message_id = None, config = None):
-		# Pull in the config for this remote type
-		self._config = self._get_type_parameters(remote_type)
-		self._config['radio_queue'] = '__DEFAULT__'
+		# Pull in the config for this remote type, which is shared by
+		# all remotes of the type
+		self._protocol = self._get_protocol(remote_type)
+		self._config = self._protocol.parameters
 
-		# Allow the user to specify some more parameters
+		# Allow the user to specify some more parameters, which are
+		# looked up before the shared ones
 		if config is not None:
-			self._config.update(config)
+			self._config = collections.ChainMap(config, self._config)
+
+		# A color lookup table only holds the colors of the offset it was
+		# built for
+		color_lookup_table = self._config.get('color_lookup_table', None)
+		if color_lookup_table is not None:
+			if color_lookup_table.get_offset() != self._config.get('color_offset', 26):
+				raise ValueError('Color lookup table offset {} does not match the color offset of {} remotes ({})'.format(color_lookup_table.get_offset(), self._protocol.name, self._config.get('color_offset', 26)))
 
-		# Store parameters
+		# Store parameters -- "_radio" is swapped for a recorder while
+		# presses are recorded, "_real_radio" is always the remote's radio
 		self._radio = radio
-		self._type = remote_type
+		self._real_radio = radio
+		self._type = self._protocol.name
 		self._id = remote_id
 
 		# Initialize the message ID for this remote
@@ -178,6 +762,43 @@ class Remote:
 		else:
 			self._message_id = message_id
 
+		# Last commanded values, per attribute and per zone (None
+		# being all zones), used when "track_state" is enabled
+		self._tracked_state = {}
+
+		# Zones turned off without being dimmed first, which are to be
+		# dimmed when they are next turned on (see "off")
+		self._deferred_dims = set()
+
+		# Restore the message ID and tracked state from a persistent
+		# store, if one is configured
+		self._store = self._config.get('state_store', None)
+		if self._store is not None:
+			self._store_slot = self._store.get_slot(remote_type, remote_id)
+			stored = self._store.load(self._store_slot)
+			if stored is not None:
+				if message_id is None:
+					self._message_id = stored[0]
+
+				if self._config.get('track_state', False):
+					self._tracked_state = self._from_stored_tracked_state(stored[1])
+
+		# Compile, or re-use, the codec for this remote
+		self._codec = self._get_codec(self._type, config)
+
+		# Serializes recording presses for this remote
+		self._record_lock = threading.Lock()
+
+		# Guards the message ID, which may be advanced from several
+		# threads (see "limitlessled_rf.pool")
+		self._message_id_lock = threading.Lock()
+
+		# Instrumentation, if enabled
+		self._metrics = self._config.get('metrics', None)
+
+		# Capture log of frames sent and received, if enabled
+		self._capture = self._config.get('capture', None)
+
 		return None
 
 	def _scale_int(self, input_value, input_range_low, input_range_high, output_range_low, output_range_high):
@@ -193,30 +814,249 @@ class Remote:
 		output = int(output + 0.5)
 		return output
 
-	def _debug(self, message):
+	def _debug(self, message, *args):
+		# Only format the message if it is going to be logged
 		if 'debug_log_command' in self._config:
+			if len(args) != 0:
+				message = message.format(*args)
 			self._config['debug_log_command'](message)
 		return None
 
-	def _get_type_parameters(self, remote_type):
-		config = {}
-		config.update(self._remote_type_parameters_map[remote_type])
+	def _sleep(self, seconds):
+		if isinstance(self._radio, _PressRecorder):
+			return self._radio.sleep(seconds)
+
+		if 'sleep_command' in self._config:
+			return self._config['sleep_command'](seconds)
+
+		time.sleep(seconds)
+		return None
+
+	def _time(self):
+		if isinstance(self._radio, _PressRecorder):
+			return self._radio.time
+
+		if 'time_command' in self._config:
+			return self._config['time_command']()
+
+		return time.monotonic()
+
+	def _record_presses(self, method, *args, **kwargs):
+		# Run a method against a recorder instead of the radio, to get
+		# the list of presses (and pauses) it would have performed
+		with self._record_lock:
+			recorder = _PressRecorder(self._time())
+			radio = self._radio
+			self._radio = recorder
+			try:
+				result = getattr(self, method)(*args, **kwargs)
+			finally:
+				self._radio = radio
+
+		return result, recorder.presses
+
+	@classmethod
+	def _get_protocol(cls, remote_type):
+		protocol = cls._protocols.get(remote_type)
+		if protocol is not None:
+			return protocol
+
+		# Some remote types are known by more than one name
+		if remote_type in cls._remote_type_alias_map:
+			protocol = cls._get_protocol(cls._remote_type_alias_map[remote_type])
+			cls._protocols[remote_type] = protocol
+			return protocol
 
 		# Supply default config values
-		if 'retries' not in config:
-			config['retries'] = 3
-		if 'delay' not in config:
-			config['delay'] = 0.1
+		parameters = {
+			'retries': 3,
+			'delay': 0.1,
+			'radio_queue': '__DEFAULT__'
+		}
+		parameters.update(cls._remote_type_parameters_map[remote_type])
+
+		# Make the parameters immutable, since they are shared
+		for name, value in parameters.items():
+			if name == 'features':
+				parameters[name] = frozenset(value)
+			elif name == 'button_map':
+				parameters[name] = types.MappingProxyType(dict(value))
+			elif isinstance(value, list):
+				parameters[name] = tuple(value)
+			elif isinstance(value, dict):
+				parameters[name] = dict(value)
+
+		protocol = _Protocol(remote_type, types.MappingProxyType(parameters),
+			getattr(cls, '_compute_button_message_' + remote_type),
+			getattr(cls, '_parse_button_message_' + remote_type),
+			getattr(cls, '_pair_' + remote_type),
+			getattr(cls, '_unpair_' + remote_type)
+		)
+
+		cls._protocols[remote_type] = protocol
+
+		return protocol
+
+	def _compute_button_message(self, button_info):
+		return self._protocol.compute_button_message(self, button_info)
+
+	def _parse_button_message(self, button_message):
+		return self._protocol.parse_button_message(self, button_message)
+
+	def pair(self, zone):
+		return self._protocol.pair(self, zone)
+
+	def unpair(self, zone):
+		return self._protocol.unpair(self, zone)
+
+	def _get_codec(self, remote_type, config):
+		# Not all protocols can be compiled
+		if not hasattr(_ButtonCodec, '_compile_' + remote_type):
+			return None
+
+		# Codecs are only shared between remotes which have not had
+		# their buttons re-configured
+		shareable = True
+		if config is not None:
+			if 'button_map' in config or 'zones' in config:
+				shareable = False
+
+		if shareable and self._protocol.codec is not None:
+			return self._protocol.codec
+
+		codec = _ButtonCodec(remote_type, self._config, self._compute_button_message)
+
+		if shareable:
+			self._protocol.codec = codec
+
+		return codec
+
+	def _encode_button_message(self, button_info):
+		if self._codec is not None:
+			message = self._codec.encode(button_info)
+			if message is not None:
+				return message
+
+		return self._compute_button_message(button_info)
+
+	def _decode_button_message(self, button_message):
+		if self._codec is not None:
+			return self._codec.decode(button_message)
+
+		return self._parse_button_message(button_message)
+
+	def _get_tracked_state(self, attribute, zone, check_resync = True):
+		if not self._config.get('track_state', False):
+			return None
+
+		values = self._tracked_state.get(attribute, {})
+
+		entry = values.get(zone)
+		if entry is None:
+			if zone is not None:
+				# Fall back to the last value sent to all zones
+				entry = values.get(None)
+			else:
+				# The value for all zones is only known if every
+				# zone agrees on it
+				zone_entries = [values.get(zone_id) for zone_id in self.get_zone_ids()]
+				if None in zone_entries:
+					return None
+
+				if len(set([zone_entry['value'] for zone_entry in zone_entries])) != 1:
+					return None
+
+				entry = min(zone_entries, key = lambda zone_entry: zone_entry['synced'])
+
+		if entry is None:
+			return None
+
+		# Periodically force a full resync so that the tracked state
+		# does not drift from what the bulbs are really doing
+		if check_resync:
+			resync_interval = self._config.get('resync_interval', None)
+			if resync_interval is not None:
+				if (self._time() - entry['synced']) > resync_interval:
+					return None
+
+		return entry
+
+	def _set_tracked_state(self, attribute, zone, value, synced = None):
+		if not self._config.get('track_state', False):
+			return None
+
+		values = self._tracked_state.setdefault(attribute, {})
+
+		if zone is None:
+			# Commands to all zones override every zone
+			values.clear()
+		else:
+			# Commands to a single zone split any value for all zones
+			# into one value per zone
+			all_zones_entry = values.pop(None, None)
+			if all_zones_entry is not None:
+				for zone_id in self.get_zone_ids():
+					values.setdefault(zone_id, all_zones_entry)
+
+		# A value of None means the value is no longer known
+		if value is None:
+			values.pop(zone, None)
+			self._store_tracked_values(attribute, values)
+			return None
+
+		if synced is None:
+			synced = self._time()
+
+		values[zone] = {
+			'value': value,
+			'synced': synced
+		}
+
+		self._store_tracked_values(attribute, values)
+
+		return None
+
+	def _store_tracked_values(self, attribute, values):
+		if self._store is None:
+			return None
+
+		# Tracked state is timed on this remote's clock, which need not
+		# be the wall clock (or survive a restart), so it is stored with
+		# wall clock times
+		offset = time.time() - self._time()
+		stored_values = {}
+		for zone, entry in values.items():
+			stored_values[zone] = {
+				'value': entry['value'],
+				'synced': entry['synced'] + offset
+			}
+
+		self._store.set_tracked_values(self._store_slot, attribute, stored_values)
+		return None
+
+	def _from_stored_tracked_state(self, tracked_state):
+		offset = self._time() - time.time()
+		for values in tracked_state.values():
+			for entry in values.values():
+				entry['synced'] += offset
 
-		setattr(self, '_compute_button_message', getattr(self, '_compute_button_message_' + remote_type))
-		setattr(self, '_parse_button_message', getattr(self, '_parse_button_message_' + remote_type))
-		setattr(self, 'pair', getattr(self, '_pair_' + remote_type))
-		setattr(self, 'unpair', getattr(self, '_unpair_' + remote_type))
+		return tracked_state
 
-		return config
+	def _forget_tracked_state(self, zone = None):
+		for attribute in list(self._tracked_state.keys()):
+			self._set_tracked_state(attribute, zone, None)
+
+		return None
 
 	def _compute_button_and_zone_from_button_id(self, button_id):
 		button_info = {}
+
+		if self._codec is not None:
+			button_info['button'], zone = self._codec.lookup_button_id(button_id)
+			if zone is not None:
+				button_info['zone'] = zone
+			return button_info
+
 		button_info['button'] = 'unknown=' + str(button_id)
 		for button_name, button_value in self._config['button_map'].items():
 			if button_value == button_id:
@@ -232,84 +1072,65 @@ class Remote:
 		return button_info
 
 	def _compute_button_message_lyh_cct(self, button_info):
-		# XXX: This protocol has not been completely reversed yet
-		if 'zone' in button_info:
-			if button_info['zone'] is None:
-				del button_info['zone']
+		zone = button_info.get('zone')
 
-		message_id = button_info['message_id']
+		button_name = button_info['button']
+		if button_name.startswith('zone_'):
+			button_name = button_name[5:]
 
-		retval = None
-
-		if button_info['button'] == 'on' and 'zone' not in button_info:
-			if 'zone' not in button_info:
-				retval = [0x85, 0xb7, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x66, 0x01, 0x59, 0xad, 0x07]
-			elif button_info['zone'] == 1:
-				retval = [0x85, 0xb7, 0x80, 0x88, 0x91, 0xb1, 0x68, 0x00, 0x67, 0x01, 0xd3, 0xff, 0x46]
-			elif button_info['zone'] == 2:
-				retval = [0x85, 0xb7, 0x80, 0x88, 0x91, 0x31, 0x69, 0x80, 0x67, 0x01, 0xd4, 0xc8, 0x11]
-			elif button_info['zone'] == 3:
-				retval = [0x85, 0xb7, 0x80, 0x88, 0x91, 0x31, 0x6a, 0x00, 0x68, 0x81, 0x55, 0xe0, 0x72]
-
-		if button_info['button'] == 'off':
-			if 'zone' not in button_info:
-				retval = [0x05, 0xb0, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x80, 0x66, 0x01, 0xd2, 0xf6, 0x46]
-			elif button_info['zone'] == 1:
-				retval = [0x05, 0xb0, 0x80, 0x88, 0x91, 0xb1, 0x68, 0x80, 0x68, 0x01, 0x4d, 0x4f, 0x0a]
-			elif button_info['zone'] == 2:
-				retval = [0x05, 0xb0, 0x80, 0x88, 0x91, 0x31, 0x69, 0x00, 0x69, 0x01, 0x4e, 0x80, 0x41]
-			elif button_info['zone'] == 3:
-				retval = [0x05, 0xb0, 0x80, 0x88, 0x91, 0x31, 0x6a, 0x80, 0x69, 0x81, 0xcf, 0x6f, 0x68]
-
-		if button_info['button'] == 'brightness_up':
-			if message_id % 2 == 0:
-				retval = [0x05, 0xb3, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x39, 0x81, 0xa7, 0x33, 0x7e]
-			else:
-				retval = [0x05, 0xb3, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x3c, 0x81, 0x2a, 0x63, 0x18]
+		button_code = self._lyh_cct_button_codes.get(button_name)
+		if button_code is None:
+			self._debug("Unsupported button: {}", button_info)
+			return None
 
-		if button_info['button'] == 'brightness_down':
-			if message_id % 2 == 0:
-				retval = [0x85, 0xb2, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x3d, 0x01, 0x2b, 0xc6, 0x61]
-			else:
-				retval = [0x85, 0xb2, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x45, 0x01, 0xb3, 0x1d, 0x3f]
+		if zone is None:
+			zone_mask = self._lyh_cct_zone_mask_all
+		elif zone in self._config['zones']:
+			zone_mask = 1 << (zone - 1)
+		else:
+			self._debug("Unsupported zone: {}", button_info)
+			return None
 
-		if button_info['button'] == 'temperature_up':
-			if message_id % 2 == 0:
-				retval = [0x85, 0xb4, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x00, 0x4b, 0x01, 0xbb, 0x9c, 0x4b]
-			else:
-				retval = [0x85, 0xb4, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x80, 0x4e, 0x81, 0x3e, 0x26, 0x00]
+		message = _lyh_cct_encode(button_code, self._lyh_cct_zone_mask_base | zone_mask, button_info['message_id'] & 0xff)
+		message.append(0x00)
+		message.append(0x0F)
+		return message
 
-		if button_info['button'] == 'temperature_down':
-			if message_id % 2 == 0:
-				retval = [0x05, 0xb5, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x80, 0x46, 0x01, 0x37, 0xd5, 0x69]
-			else:
-				retval = [0x05, 0xb5, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x80, 0x4a, 0x01, 0x3b, 0x1a, 0x06]
+	def _parse_button_message_lyh_cct(self, button_message):
+		# Verify the check bytes -- if not valid, return None
+		fields = _lyh_cct_decode(button_message)
+		if fields is None:
+			return None
 
-		if button_info['button'] == 'max':
-			retval = [0x85, 0xb7, 0x80, 0x88, 0x91, 0xb1, 0x6f, 0x80, 0x66, 0x81, 0xd9, 0x07, 0x22]
+		button_code, zone_mask, sequence = fields
 
-		if retval is None:
-			self._debug("Unsupported button: {}".format(button_info))
-			return None
+		button_info = ButtonEvent(
+			message_id = sequence,
+			raw = button_message
+		)
 
-		# XXX: This probably breaks the CRC :-(
-		if 'zone' in button_info:
-			retval[6] = (retval[6] & 0xf0) | (0x07 + button_info['zone'])
-		else:
-			retval[6] = (retval[6] & 0xf0) | 0x0f
+		button_name = self._lyh_cct_button_names.get(button_code, 'unknown=' + str(button_code))
 
-		retval.append(0x00)
-		retval.append(0x0F)
-		return retval
+		zone_mask = zone_mask & ~self._lyh_cct_zone_mask_base
+		if zone_mask != self._lyh_cct_zone_mask_all:
+			zone = zone_mask.bit_length()
+			if zone_mask != (1 << (zone - 1)):
+				return None
 
-	def _parse_button_message_lyh_cct(self, button_message):
-		return {'raw': button_message}
-		return None
+			if button_name in ['on', 'off']:
+				button_name = 'zone_' + button_name
+			button_info['zone'] = zone
+
+		button_info['button'] = button_name
+
+		return button_info
 
+	@_instrumented('pair')
 	def _pair_lyh_cct(self, zone):
 		# XXX
 		return None
 
+	@_instrumented('unpair')
 	def _unpair_lyh_cct(self, zone):
 		# XXX
 		return None
@@ -318,9 +1139,6 @@ class Remote:
 		remote_id = button_info['remote_id']
 		message_id = button_info['message_id']
 
-		# Header consists of magic (0x5A), follow by 16-bit remote ID
-		header = [0x5A, (remote_id >> 8) & 0xff, remote_id & 0xff]
-
 		# Determine zone, default to all
 		zone = button_info.get('zone', 0)
 
@@ -332,35 +1150,27 @@ class Remote:
 		# Look up the button
 		button_id = self._config['button_map'][button_name]
 
-		# Compute message body
-		body = [zone, button_id, message_id]
-
-		# Compute the whole message so far
-		message = header + body
+		# Header consists of magic (0x5A), follow by 16-bit remote ID,
+		# then the body and the trailer
+		message = bytearray([0x5A, (remote_id >> 8) & 0xff, remote_id & 0xff, zone, button_id, message_id, 0])
 
 		# Compute message trailer
 		## Include a CRC, for good measure
-		crc = len(message) + 1
-		for byte in message:
-			crc = crc + byte
-		crc = crc & 0xff
-		trailer = [crc]
-
-		message = message + trailer
+		message[6] = (len(message) + sum(message)) & 0xff
 
 		return message
 
 	def _parse_button_message_cct(self, button_message):
-		button_info = {}
-
 		# Verify the header -- if it is not valid, return None
 		if button_message[0] != 0x5A:
 			return None
 
 		# Parse out common parts of the message
-		button_info['remote_id'] = (button_message[1] << 8) | button_message[2]
-		button_info['zone'] = button_message[3]
-		button_info['message_id'] = button_message[5]
+		button_info = ButtonEvent(
+			remote_id = (button_message[1] << 8) | button_message[2],
+			zone = button_message[3],
+			message_id = button_message[5]
+		)
 
 		# Remove the all zone
 		if button_info['zone'] == 0:
@@ -372,23 +1182,137 @@ class Remote:
 
 		return button_info
 
+	@_instrumented('pair')
 	def _pair_cct(self, zone):
-		self._send_button({
-			'button': 'zone_on',
-			'zone': zone
-		})
+		self._forget_tracked_state(zone)
+
+		self._send_button(ButtonEvent(button = 'zone_on', zone = zone))
 
 		# Ensure that the "on" button cannot be hit soon after
 		# because it might trigger the unpair flow
-		time.sleep(5)
+		self._sleep(5)
 		return True
 
+	@_instrumented('unpair')
 	def _unpair_cct(self, zone):
+		self._forget_tracked_state(zone)
+
 		for retry in range(7):
-			self._send_button({
-				'button': 'zone_on',
-				'zone': zone
-			})
+			self._send_button(ButtonEvent(button = 'zone_on', zone = zone))
+		return True
+
+	def _compute_button_message_rgbcct(self, button_info):
+		remote_id = button_info['remote_id']
+		zone = button_info.get('zone', 0)
+
+		# The same commands are used for all zones and single zones,
+		# with the zone in its own byte
+		button_name = button_info['button']
+		if button_name.startswith('zone_'):
+			button_name = button_name[5:]
+
+		# Going to white is done by setting the color temperature
+		if button_name == 'white':
+			button_name = 'set_temperature'
+			tracked = self._get_tracked_state('temperature', button_info.get('zone'), check_resync = False)
+			if tracked is not None:
+				temperature = tracked['value']
+			else:
+				temperature = self._config['temperature_output_range'][0]
+		else:
+			temperature = button_info.get('temperature', 0)
+
+		command = self._config['button_map'][button_name]
+
+		zone_count = len(self._config['zones'])
+		if button_name == 'on':
+			argument = zone
+		elif button_name in ['off', 'night']:
+			argument = zone + zone_count + 1
+		elif button_name == 'set_color':
+			argument = button_info['color']
+		elif button_name == 'set_temperature':
+			# From coldest (0) to warmest (100), in steps of 2
+			argument = 0xCC + ((100 - temperature) * 2)
+		elif button_name == 'set_brightness':
+			argument = 0x8F + button_info['brightness']
+		elif button_name == 'set_saturation':
+			argument = 0x0D + button_info['saturation']
+		else:
+			argument = button_info.get('brightness', 0)
+
+		packet = [0x00, self._config['protocol_id'], (remote_id >> 8) & 0xff, remote_id & 0xff, command, argument & 0xff, button_info['message_id'], zone, 0x00]
+
+		return _v2_scramble(packet)
+
+	def _parse_button_message_rgbcct(self, button_message):
+		if len(button_message) < 9:
+			return None
+
+		# Verify the checksum and protocol -- if not valid, return None
+		packet = _v2_unscramble(button_message)
+		if packet is None or packet[1] != self._config['protocol_id']:
+			return None
+
+		button_info = ButtonEvent(
+			remote_id = (packet[2] << 8) | packet[3],
+			message_id = packet[6]
+		)
+
+		zone_count = len(self._config['zones'])
+		command = packet[4]
+		argument = packet[5]
+		zone = packet[7]
+
+		if command == 0x01 and argument <= zone_count:
+			button_name = 'on'
+		elif command == 0x01 and argument <= ((zone_count * 2) + 1):
+			button_name = 'off'
+		elif command == 0x81:
+			button_name = 'night'
+		elif command == 0x02:
+			button_name = 'set_color'
+			button_info['color'] = argument
+		elif command == 0x03:
+			button_name = 'set_temperature'
+			button_info['temperature'] = 100 - (((argument - 0xCC) & 0xff) // 2)
+		elif command == 0x04 and ((argument - 0x8F) & 0xff) <= 100:
+			button_name = 'set_brightness'
+			button_info['brightness'] = (argument - 0x8F) & 0xff
+		elif command == 0x04:
+			button_name = 'set_saturation'
+			button_info['saturation'] = (argument - 0x0D) & 0xff
+		elif command == 0x05:
+			button_name = 'mode'
+			button_info['brightness'] = argument
+		else:
+			button_name = 'unknown=' + str(command)
+
+		if zone != 0:
+			button_name = 'zone_' + button_name
+			button_info['zone'] = zone
+
+		button_info['button'] = button_name
+
+		return button_info
+
+	@_instrumented('pair')
+	def _pair_rgbcct(self, zone):
+		self._forget_tracked_state(zone)
+
+		self._send_button(ButtonEvent(button = 'zone_on', zone = zone))
+
+		# Ensure that the "on" button cannot be hit soon after
+		# because it might trigger the unpair flow
+		self._sleep(5)
+		return True
+
+	@_instrumented('unpair')
+	def _unpair_rgbcct(self, zone):
+		self._forget_tracked_state(zone)
+
+		for retry in range(5):
+			self._send_button(ButtonEvent(button = 'zone_on', zone = zone))
 		return True
 
 	def _compute_button_message_rgbw(self, button_info):
@@ -407,9 +1331,6 @@ class Remote:
 			if 'zone' in button_info:
 				del button_info['zone']
 
-		# Header consists of magic (0xB0), follow by 16-bit remote ID
-		header = [0xB0, (remote_id >> 8) & 0xff, remote_id & 0xff]
-
 		# Default value for most buttons, since they do not need it
 		brightness = 0
 		color = 0
@@ -446,26 +1367,24 @@ class Remote:
 			zone_value = button_info['zone']
 		brightness |= zone_value & 0b111
 
-		# Compute message
-		body = [color, brightness, button_id, message_id]
-
-		# Compute whole message
-		message = header + body
+		# Header consists of magic (0xB0), follow by 16-bit remote ID,
+		# then the body
+		message = bytearray([0xB0, (remote_id >> 8) & 0xff, remote_id & 0xff, color, brightness, button_id, message_id])
 
 		return message
 
 	def _parse_button_message_rgbw(self, button_message):
-		button_info = {}
-
 		# Verify the header -- if it is not valid, return None
 		if button_message[0] != 0xB0:
 			return None
 
 		# Parse out common parts of the message
-		button_info['remote_id'] = (button_message[1] << 8) | button_message[2]
-		button_info['color'] = button_message[3]
-		button_info['brightness'] = button_message[4]
-		button_info['message_id'] = button_message[6]
+		button_info = ButtonEvent(
+			remote_id = (button_message[1] << 8) | button_message[2],
+			color = button_message[3],
+			brightness = button_message[4],
+			message_id = button_message[6]
+		)
 
 		# Map the button ID to a button name
 		button_id = button_message[5]
@@ -487,32 +1406,99 @@ class Remote:
 
 		return button_info
 
+	@_instrumented('pair')
 	def _pair_rgbw(self, zone):
-		self._send_button({
-			'button': 'zone_on',
-			'zone': zone
-		})
+		self._forget_tracked_state(zone)
+
+		self._send_button(ButtonEvent(button = 'zone_on', zone = zone))
 		return False
 
+	@_instrumented('unpair')
 	def _unpair_rgbw(self, zone):
-		self._send_button({
-			'button': 'zone_on',
-			'zone': zone
-		})
-		self._send_button({
-			'button': 'zone_white',
-			'zone': zone
-		})
+		self._forget_tracked_state(zone)
+
+		self._send_button(ButtonEvent(button = 'zone_on', zone = zone))
+		self._send_button(ButtonEvent(button = 'zone_white', zone = zone))
 		return False
 
 	def _get_next_message_id(self):
 		# Determine next message ID
-		self._message_id = (self._message_id + 1) & 0xff
-		return self._message_id
+		with self._message_id_lock:
+			self._message_id = (self._message_id + 1) & 0xff
+			return self._message_id
+
+	def _record_press_metrics(self, button_info, retries, delay, encode_time, radio_time):
+		remote_labels = {
+			'remote_type': self._type,
+			'remote_id':   self._id
+		}
+		labels = {
+			'remote_type': self._type,
+			'remote_id':   self._id,
+			'button':      button_info['button'],
+			'zone':        button_info.get('zone', 'all')
+		}
+		frames = retries * len(self._config['channels'])
+
+		self._metrics.increment('limitlessled_rf_presses_total', labels)
+		self._metrics.increment('limitlessled_rf_frames_total', labels, frames)
+		self._metrics.increment('limitlessled_rf_retries_total', labels, retries)
+		self._metrics.observe('limitlessled_rf_encode_seconds', encode_time, remote_labels)
+		self._metrics.observe('limitlessled_rf_radio_seconds', radio_time, remote_labels)
+		self._metrics.record_press(retries, frames, retries * delay)
+
+		return None
+
+	def _prepare_transmit(self, radio, message, channels, retries, delay, syncword = None, **kwargs):
+		# Settle the number of retries of a press about to be transmitted
+		# on "radio" (see "retry_policy") and log it to the capture, if
+		# enabled.  This takes the same parameters as the radio's
+		# "multi_transmit" so that presses which were recorded are only
+		# prepared when they are really transmitted, and returns the
+		# positional parameters to transmit them with.
+		if 'retry_policy' in self._config:
+			retries = self._config['retry_policy'].get_retries(self, message, retries, radio = radio)
+
+		if self._capture is not None:
+			self._capture.write('transmit', self._type, syncword, channels, retries, delay, message)
+
+		return message, channels, retries, delay
+
+	def _transmit(self, radio, press_info, message, channels, retries, delay, **kwargs):
+		# Prepare a press and transmit it on "radio", then record its
+		# metrics, if enabled, from the parameters it was really
+		# transmitted with.  This is shared by presses sent directly
+		# and presses which were recorded and are transmitted later,
+		# so that both report the same numbers.
+		message, channels, retries, delay = self._prepare_transmit(radio, message, channels, retries, delay, **kwargs)
+
+		metrics = self._metrics
+		if metrics is not None:
+			radio_start = time.perf_counter()
+
+		radio.multi_transmit(message, channels, retries, delay, **kwargs)
+
+		if metrics is not None:
+			self._record_transmit_metrics(press_info, retries, delay, time.perf_counter() - radio_start)
+
+		return None
+
+	def _record_transmit_metrics(self, press_info, retries, delay, radio_time):
+		# Record the metrics of a transmitted press, given the
+		# "press_info" it was recorded with
+		if press_info is None:
+			return None
+
+		button_info, encode_time = press_info
+		self._record_press_metrics(button_info, retries, delay, encode_time, radio_time)
+
+		return None
 
 	def _send_button(self, button_info, post_delay = None):
+		metrics = self._metrics
+
 		# Include the remote ID unless one was supplied
-		button_info = button_info.copy()
+		button_info = ButtonEvent.from_dict(button_info)
 		if 'remote_id' not in button_info:
 			button_info['remote_id'] = self._id
 
@@ -521,10 +1507,27 @@ class Remote:
 				message_id = self._get_next_message_id()
 				button_info['message_id'] = message_id
 			else:
-				self._message_id = button_info['message_id']
+				message_id = button_info['message_id']
+				with self._message_id_lock:
+					self._message_id = message_id
+
+			if self._store is not None:
+				self._store.set_message_id(self._store_slot, message_id)
 
 		# Compute message
-		message = self._compute_button_message(button_info)
+		if metrics is not None:
+			encode_start = time.perf_counter()
+
+		message = self._encode_button_message(button_info)
+
+		if metrics is not None:
+			press_info = (button_info, time.perf_counter() - encode_start)
+		else:
+			press_info = None
+
+		# Nothing can be sent for buttons the protocol cannot encode
+		if message is None:
+			return False
 
 		# Transmit
 		if 'delay' in button_info:
@@ -541,28 +1544,159 @@ class Remote:
 		if post_delay is not None:
 			delay = post_delay
 
-		self._debug("Sending {}={} n={} times with a {}s delay to queue {}, format = {}".format(button_info, message, retries, delay, self._config['radio_queue'], format_config))
-		self._radio.multi_transmit(message, self._config['channels'], retries, delay, syncword = self._config['syncword'], submit_queue = self._config['radio_queue'], format_config = format_config)
+		self._debug("Sending {}={} n={} times with a {}s delay to queue {}, format = {}", button_info, message, retries, delay, self._config['radio_queue'], format_config)
+
+		# Recorded presses are prepared, and their metrics recorded,
+		# when they are really transmitted
+		if isinstance(self._radio, _PressRecorder):
+			self._radio.multi_transmit(message, self._config['channels'], retries, delay, press_info = press_info, syncword = self._config['syncword'], submit_queue = self._config['radio_queue'], format_config = format_config)
+		else:
+			self._transmit(self._radio, press_info, message, self._config['channels'], retries, delay, syncword = self._config['syncword'], submit_queue = self._config['radio_queue'], format_config = format_config)
 
 		return True
 
-	def _set_brightness(self, brightness, zone = None, transition = None):
+	def _set_brightness(self, brightness, zone = None, transition = None, easing = None):
+		if zone is None:
+			message = ButtonEvent(button = 'set_brightness')
+		else:
+			message = ButtonEvent(button = 'zone_set_brightness', zone = zone)
+
 		if transition is not None:
-			self._debug('Tranisition not supported for SET-type bulbs (yet)')
+			tracked = self._get_tracked_state('brightness', zone, check_resync = False)
+			if tracked is None:
+				self._debug('Transition requires a known starting brightness (see "track_state"), setting it directly')
+			else:
+				self._transition_brightness(message, tracked['value'], brightness, transition, easing)
+
+		message['brightness'] = brightness
+
+		self._set_tracked_state('brightness', zone, brightness)
 
+		return self._send_button(message)
+
+	def _set_temperature(self, temperature, zone = None):
 		if zone is None:
-			message = {'button': 'set_brightness'}
+			message = ButtonEvent(button = 'set_temperature')
 		else:
-			message = {
-				'button': 'zone_set_brightness',
-				'zone': zone
-			}
+			message = ButtonEvent(button = 'zone_set_temperature', zone = zone)
 
-		message['brightness'] = brightness
+		message['temperature'] = temperature
+
+		# Setting the temperature also turns color bulbs white
+		self._set_tracked_state('temperature', zone, temperature)
+		if 'has_color' in self._config['features']:
+			self._set_tracked_state('mode', zone, 'white')
 
 		return self._send_button(message)
 
+	def _transition_brightness(self, message, start_value, target_value, transition, easing = None):
+		# Send the intermediate brightness frames of a transition, but
+		# not the final frame, which is left to the caller
+		if easing is None:
+			easing = self._config.get('transition_easing', 'linear')
+		if not callable(easing):
+			easing = self._easing_functions[easing]
+
+		# Each frame costs its full airtime, so send no more frames than
+		# fit in the transition, and no more than there are brightness
+		# levels to pass through
+		frame_airtime = self._config['retries'] * self._config['delay']
+		frame_count = abs(target_value - start_value)
+		if frame_airtime > 0:
+			frame_count = min(frame_count, int(transition / frame_airtime))
+
+		if frame_count <= 1:
+			return None
+
+		# Compute when each frame should go out, so that the final
+		# frame arrives at the end of the transition
+		frames = []
+		for frame in range(1, frame_count + 1):
+			progress = frame / frame_count
+			value = start_value + (target_value - start_value) * easing(progress)
+			value = int(value + 0.5)
+
+			# Do not send the same value twice in a row
+			if len(frames) != 0 and frames[-1][1] == value:
+				frames[-1] = (frames[-1][0], value)
+				continue
+			if len(frames) == 0 and value == start_value:
+				continue
+
+			frames.append((max(0, (transition * progress) - frame_airtime), value))
+
+		start_time = self._time()
+		for index, (frame_time, value) in enumerate(frames[:-1]):
+			# If the radio has fallen behind, drop this frame rather
+			# than falling further behind
+			now = self._time() - start_time
+			if now > frames[index + 1][0]:
+				self._debug("Dropping transition frame with brightness {}, {} s behind", value, now - frame_time)
+				continue
+
+			if now < frame_time:
+				self._sleep(frame_time - now)
+
+			frame_message = message.copy()
+			frame_message['brightness'] = value
+			self._send_button(frame_message)
+
+		# Wait for the final frame's slot
+		now = self._time() - start_time
+		if now < frames[-1][0]:
+			self._sleep(frames[-1][0] - now)
+
+		return None
+
+	def _step_presses(self, button_prefix, direction, steps, zone, transition = None):
+		step_command = ButtonEvent(button = "{}_{}".format(button_prefix, direction))
+		if zone is not None:
+			step_command['zone'] = zone
+
+		transition_delay = None
+		if transition is not None and steps > 1:
+			transition_delay = transition / (steps - 1)
+
+		for step in range(steps):
+			if step == (steps - 1):
+				transition_delay = None
+
+			self._debug("[FINAL] Stepping {} {} with a delay of {} (ms) afterwards", button_prefix, direction, transition_delay)
+			if not self._send_button(step_command, post_delay = transition_delay):
+				return False
+
+		return True
+
 	def _step_value(self, target_value, target_range_min, target_range_max, button_prefix, zone, midpoint = None, transition = None):
+		# If the current value is being tracked, only step the
+		# difference -- unless going via the "max" button is cheaper
+		tracked = self._get_tracked_state(button_prefix, zone)
+		if tracked is not None:
+			current_value = tracked['value']
+			if current_value < target_value:
+				delta_direction = 'up'
+				delta_steps = target_value - current_value
+			else:
+				delta_direction = 'down'
+				delta_steps = current_value - target_value
+
+			# Pressing "max" and stepping down from there may be cheaper
+			if 'has_max_{}'.format(button_prefix) in self._config['features']:
+				if (1 + target_range_max - target_value) < delta_steps:
+					self._debug("[DELTA] Going to max {} then stepping down to {}", button_prefix, target_value)
+					if not getattr(self, "_max_{}".format(button_prefix))(zone):
+						return False
+					if not self._step_presses(button_prefix, 'down', target_range_max - target_value, zone, transition):
+						return False
+					self._set_tracked_state(button_prefix, zone, target_value)
+					return True
+
+			self._debug("[DELTA] Stepping {} {} from {} to {}", button_prefix, delta_direction, current_value, target_value)
+			if not self._step_presses(button_prefix, delta_direction, delta_steps, zone, transition):
+				return False
+			self._set_tracked_state(button_prefix, zone, target_value, synced = tracked['synced'])
+			return True
+
 		# Step all the way to the nearest extreme before moving it to
 		# where it should be
 		target_range = target_range_max - target_range_min + 1
@@ -588,16 +1722,18 @@ class Remote:
 				use_max_button = True
 
 		if use_max_button:
-			self._debug("[INITIAL] Going to max {}".format(button_prefix))
-			getattr(self, "_max_{}".format(button_prefix))(zone)
+			self._debug("[INITIAL] Going to max {}", button_prefix)
+			if not getattr(self, "_max_{}".format(button_prefix))(zone):
+				return False
 		else:
 			# Otherwise, step it
-			step_command = {'button': "{}_{}".format(button_prefix, initial_direction)}
+			step_command = ButtonEvent(button = "{}_{}".format(button_prefix, initial_direction))
 			if zone is not None:
 				step_command['zone'] = zone
 			for step in range(initial_steps):
-				self._debug("[INITIAL] Stepping {} {}".format(button_prefix, initial_direction))
-				self._send_button(step_command)
+				self._debug("[INITIAL] Stepping {} {}", button_prefix, initial_direction)
+				if not self._send_button(step_command):
+					return False
 
 		# Now that we have forced the value to the extreme, move in
 		# steps from that value to the desired value
@@ -606,20 +1742,11 @@ class Remote:
 		else:
 			final_steps = initial_value - target_value
 
-		step_command = {'button': "{}_{}".format(button_prefix, final_direction)}
-		if zone is not None:
-			step_command['zone'] = zone
-
-		transition_delay = None
-		if transition is not None and final_steps > 1:
-			transition_delay = transition / (final_steps - 1)
-
-		for step in range(final_steps):
-			if step == (final_steps - 1):
-				transition_delay = None
+		# Presses which cannot be sent leave the tracked state as it was
+		if not self._step_presses(button_prefix, final_direction, final_steps, zone, transition):
+			return False
 
-			self._debug("[FINAL] Stepping {} {} with a delay of {} (ms) afterwards".format(button_prefix, final_direction, transition_delay))
-			self._send_button(step_command, post_delay = transition_delay)
+		self._set_tracked_state(button_prefix, zone, target_value)
 
 		return True
 
@@ -641,33 +1768,19 @@ class Remote:
 
 	def _max_brightness(self, zone = None):
 		if zone is None:
-			message = {'button': 'max'}
+			message = ButtonEvent(button = 'max')
 		else:
-			message = {
-				'button': 'zone_max',
-				'zone': zone
-			}
-		return self._send_button(message)
+			message = ButtonEvent(button = 'zone_max', zone = zone)
 
-	def _rgb_to_hue(self, r, g, b):
-		r = r / 255.0
-		g = g / 255.0
-		b = b / 255.0
+		if not self._send_button(message):
+			return False
 
-		cmax = max(r, max(g, b))
-		cmin = min(r, min(g, b))
-		diff = cmax - cmin
+		self._set_tracked_state('brightness', zone, self._config['brightness_range'][1])
 
-		if cmax == cmin:
-			h = 0
-		elif cmax == r:
-			h = (60 * ((g - b) / diff) + 360) % 360
-		elif cmax == g:
-			h = (60 * ((b - r) / diff) + 120) % 360
-		elif cmax == b:
-			h = (60 * ((r - g) / diff) + 240) % 360
+		return True
 
-		return h
+	def _rgb_to_hue(self, r, g, b):
+		return color.rgb_to_hue(r, g, b)
 
 	def _rgb_to_color(self, rgb):
 		r = (rgb >> 16) & 0xff
@@ -680,6 +1793,10 @@ class Remote:
 		if r == g and g == b:
 			return (r * -1) - 1
 
+		# Use the precomputed lookup table, if one was supplied
+		if 'color_lookup_table' in self._config:
+			return self._config['color_lookup_table'].lookup(rgb)
+
 		# Compute the hue of the RGB value (ignore
 		# luminance and saturation)
 		h = self._rgb_to_hue(r, g, b)
@@ -687,39 +1804,55 @@ class Remote:
 		# Convert the hue into a LimitlessLED value
 		# which is really just the position along the
 		# color strip, offset
-		color = ((h / 360.0) * 255.0) + 26
-		color = color % 256
-
-		color = int(color + 0.5)
+		value = color.hue_to_color(h, self._config.get('color_offset', 26))
 
-		self._debug("RGB = \x1b[38;2;%i;%i;%im%06x\x1b[0m; Hue = %s; Color = %i" % (r, g, b, rgb, str(h * 360), color))
+		self._debug("RGB = \x1b[38;2;{};{};{}m{:06x}\x1b[0m; Hue = {}; Color = {}", r, g, b, rgb, str(h * 360), value)
 
-		return color
+		return value
 
+	@_instrumented('raw_send_button')
 	def raw_send_button(self, button_info):
 		return self._send_button(button_info)
 
 	def raw_read_button(self):
+		return self._read_button(self._radio)
+
+	def _read_button(self, radio):
 		channel = self._config['channels'][0]
-		self._radio.set_syncword(self._config['syncword'], submit_queue = None)
-		self._radio.start_listening(channel)
+		radio.set_syncword(self._config['syncword'], submit_queue = None)
+		radio.start_listening(channel)
 
 		# Some protocols are not length encoded, specify the length instead
 		length = self._config.get('message_length', None)
 		format_config = self._config.get('format_config', None)
 
-		data = self._radio.receive(channel = channel, wait = True, wait_time = 0.1, length = length, format_config = format_config)
-		message = self._parse_button_message(data)
+		data = radio.receive(channel = channel, wait = True, wait_time = 0.1, length = length, format_config = format_config)
+		if data is not None and self._capture is not None:
+			self._capture.write('receive', self._type, self._config['syncword'], [channel], 0, 0.0, data)
+
+		message = self._decode_button_message(data)
 		return message
 
-	def set_brightness(self, brightness, zone = None, transition = None):
+	def read_buttons(self, timeout = None, window = None, dwell = 0.05, cache_size = 256):
+		return receiver.ButtonReceiver(self, window, dwell, cache_size).events(timeout)
+
+	@_instrumented('set_brightness')
+	def set_brightness(self, brightness, zone = None, transition = None, easing = None):
 		if 'has_brightness' not in self._config['features']:
 			return False
 
 		if brightness < 0 or brightness > 255:
 			return False
 
-		self._debug("Setting brightness to {} with transition {} s".format(brightness, transition))
+		self._debug("Setting brightness to {} with transition {} s", brightness, transition)
+
+		# An explicit brightness replaces any dimming deferred until the
+		# bulbs are turned on
+		if zone is None:
+			self._deferred_dims.clear()
+		else:
+			self._deferred_dims.discard(zone)
+
 		if brightness == 0:
 			self._debug("Really setting to off")
 			return self.off(zone)
@@ -734,10 +1867,11 @@ class Remote:
 		brightness = self._scale_int(brightness, 1, 255, self._config['brightness_range'][0], self._config['brightness_range'][1])
 
 		if 'can_set_brightness' in self._config['features']:
-			return self._set_brightness(brightness, zone, transition)
+			return self._set_brightness(brightness, zone, transition, easing)
 		else:
 			return self._step_brightness(brightness, brightness_min, brightness_max, zone, transition)
 
+	@_instrumented('set_color')
 	def set_color(self, rgb, zone = None):
 		# Compute the color value from the RGB value
 		value = self._rgb_to_color(rgb)
@@ -746,7 +1880,7 @@ class Remote:
 		# bulbs white at that brightness
 		if value < 0:
 			brightness = (value + 1) * -1
-			self._debug("Brightness = {}".format(brightness))
+			self._debug("Brightness = {}", brightness)
 			if self.white(zone):
 				return self.set_brightness(brightness, zone)
 			else:
@@ -758,14 +1892,17 @@ class Remote:
 
 		# Press the correct color button
 		if zone is None:
-			message = {'button': 'set_color'}
+			message = ButtonEvent(button = 'set_color')
 		else:
-			message = {'button': 'zone_set_color', 'zone': zone}
+			message = ButtonEvent(button = 'zone_set_color', zone = zone)
 		message['color'] = value
 
+		self._set_tracked_state('mode', zone, 'color')
+
 		# Press the button
 		return self._send_button(message)
 
+	@_instrumented('set_temperature')
 	def set_temperature(self, kelvins, zone = None):
 		if 'has_temperature' not in self._config['features']:
 			return False
@@ -787,21 +1924,19 @@ class Remote:
 			kelvins = temperature_input_coldest
 
 		temperature = self._scale_int(kelvins, temperature_input_coldest, temperature_input_warmest, temperature_output_coldest, temperature_output_warmest)
-		self._debug("Scaled kelvins={} to a temperature value of {}".format(kelvins, temperature))
+		self._debug("Scaled kelvins={} to a temperature value of {}", kelvins, temperature)
 
 		if 'can_set_temperature' in self._config['features']:
 			return self._set_temperature(temperature, zone)
 		else:
 			return self._step_temperature(temperature, temperature_output_coldest, temperature_output_warmest, zone)
 
+	@_instrumented('on')
 	def on(self, zone = None, try_hard = False):
 		if zone is None:
-			message = {'button': 'on'}
+			message = ButtonEvent(button = 'on')
 		else:
-			message = {
-				'button': 'zone_on',
-				'zone': zone
-			}
+			message = ButtonEvent(button = 'zone_on', zone = zone)
 
 		# Increase retries and delay for on/off to ensure
 		# that these important messages are delivered
@@ -809,22 +1944,51 @@ class Remote:
 			message['retries'] = self._config['retries'] * 2
 			message['delay'] = self._config['delay'] * 2
 
-		return self._send_button(message)
+		if not self._send_button(message):
+			return False
+
+		self._apply_deferred_dims(zone)
 
+		return True
+
+	def _apply_deferred_dims(self, zone):
+		# Dim the zones being turned on whose dimming was put off when
+		# they were turned off
+		if zone is None:
+			zones = set(self._deferred_dims)
+		else:
+			zones = self._deferred_dims & set([zone])
+
+		if len(zones) == 0:
+			return None
+
+		if zone is None and zones == set(self.get_zone_ids()):
+			self.set_brightness(1)
+		else:
+			for dim_zone in sorted(zones):
+				self.set_brightness(1, dim_zone)
+
+		return None
+
+	@_instrumented('off')
 	def off(self, zone = None, dim = True, try_hard = False):
-		# Dim the bulbs so that when turned on they are not bright
-		if dim:
+		# Dim the bulbs so that when turned on they are not bright,
+		# unless the dimming is deferred until they are next turned on
+		if dim is True and self._config.get('deferred_dim', False):
+			dim = 'deferred'
+
+		if dim == 'deferred':
+			if zone is None:
+				self._deferred_dims.update(self.get_zone_ids())
+			else:
+				self._deferred_dims.add(zone)
+		elif dim:
 			self.set_brightness(1, zone)
 
 		if zone is None:
-			message = {
-				'button': 'off',
-			}
+			message = ButtonEvent(button = 'off')
 		else:
-			message = {
-				'button': 'zone_off',
-				'zone': zone
-			}
+			message = ButtonEvent(button = 'zone_off', zone = zone)
 
 		# Increase retries and delay for on/off to ensure
 		# that these important messages are delivered
@@ -834,20 +1998,23 @@ class Remote:
 
 		return self._send_button(message)
 
+	@_instrumented('night')
 	def night(self, zone = None):
 		# If the bulbs do not support night, nothing needs to be done
 		if 'has_night' not in self._config['features']:
 			return False
 
 		if zone is None:
-			message = {'button': 'night'}
+			message = ButtonEvent(button = 'night')
 		else:
-			message = {
-				'button': 'zone_night',
-				'zone': zone
-			}
+			message = ButtonEvent(button = 'zone_night', zone = zone)
+
+		# Night mode leaves the brightness in an unknown state
+		self._set_tracked_state('brightness', zone, None)
+
 		return self._send_button(message)
 
+	@_instrumented('white')
 	def white(self, zone = None):
 		# If the bulbs are already white, nothing needs to be done
 		if 'is_white' in self._config['features']:
@@ -858,17 +2025,43 @@ class Remote:
 			return False
 
 		if zone is None:
-			message = {'button': 'white'}
+			message = ButtonEvent(button = 'white')
 		else:
-			message = {
-				'button': 'zone_white',
-				'zone': zone
-			}
+			message = ButtonEvent(button = 'zone_white', zone = zone)
+
+		self._set_tracked_state('mode', zone, 'white')
+
 		return self._send_button(message)
 
+	@_instrumented('resync')
+	def resync(self, zone = None):
+		# Force the tracked values back onto the bulbs by stepping from
+		# an extreme, so that the tracked state cannot drift
+		attribute_ranges = {
+			'brightness':  'brightness_range',
+			'temperature': 'temperature_output_range'
+		}
+		for attribute, range_name in attribute_ranges.items():
+			tracked = self._get_tracked_state(attribute, zone, check_resync = False)
+			if tracked is None:
+				continue
+
+			self._set_tracked_state(attribute, zone, None)
+
+			value = tracked['value']
+			value_min = self._config[range_name][0]
+			value_max = self._config[range_name][1]
+
+			if 'can_set_{}'.format(attribute) in self._config['features']:
+				getattr(self, '_set_{}'.format(attribute))(value, zone)
+			else:
+				getattr(self, '_step_{}'.format(attribute))(value, value_min, value_max, zone)
+
+		return True
+
 	# Methods to query remote identity and state
 	def get_zone_ids(self):
-		return self._config.get('zones', [1, 2, 3, 4])
+		return list(self._config.get('zones', [1, 2, 3, 4]))
 
 	def get_type(self):
 		return self._type
@@ -886,4 +2079,8 @@ class Remote:
 	def get_temperature_range(self):
 		# If the remote has no control over the temperature this
 		# query gets a null response
-		return self._config.get('temperature_input_range', None)
+		temperature_range = self._config.get('temperature_input_range', None)
+		if temperature_range is None:
+			return None
+
+		return list(temperature_range)
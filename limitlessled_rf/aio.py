@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+
+import asyncio
+import functools
+import inspect
+import time
+
+from . import Remote
+
+class RadioAdapter:
+	# Adapts a radio for use from asyncio.  Radios which offer an
+	# "async_multi_transmit" coroutine are awaited directly, the
+	# blocking calls of any other radio are run in an executor.
+	def __init__(self, radio, executor = None):
+		self.radio = radio
+		self._executor = executor
+		self._lock = None
+		return None
+
+	def _get_lock(self):
+		# Created lazily so that it belongs to the running event loop
+		if self._lock is None:
+			self._lock = asyncio.Lock()
+		return self._lock
+
+	async def run_blocking(self, method, *args, **kwargs):
+		loop = asyncio.get_running_loop()
+		call = functools.partial(getattr(self.radio, method), *args, **kwargs)
+		return await loop.run_in_executor(self._executor, call)
+
+	async def multi_transmit(self, message, channels, retries, delay, **kwargs):
+		# Only one press may be on the air at a time per radio
+		async with self._get_lock():
+			native_multi_transmit = getattr(self.radio, 'async_multi_transmit', None)
+			if native_multi_transmit is not None:
+				result = await native_multi_transmit(message, channels, retries, delay, **kwargs)
+
+				# Always give other tasks a chance to run between presses
+				await asyncio.sleep(0)
+				return result
+
+			return await self.run_blocking('multi_transmit', message, channels, retries, delay, **kwargs)
+
+class AsyncRemote:
+	# An asyncio front-end for Remote: every press (and every pause
+	# between presses) yields to the event loop
+	def __init__(self, radio, remote_type, remote_id, message_id = None, config = None, executor = None):
+		# Remotes sharing a radio should share its adapter
+		if isinstance(radio, RadioAdapter):
+			self._adapter = radio
+		else:
+			self._adapter = RadioAdapter(radio, executor)
+
+		self._remote = Remote(self._adapter.radio, remote_type, remote_id, message_id, config)
+
+		return None
+
+	async def _sleep(self, seconds):
+		# Pause with the remote's own "sleep_command", if configured, so
+		# that simulated and virtual clocks are honoured; it may be a
+		# coroutine function
+		sleep_command = self._remote._config.get('sleep_command', None)
+		if sleep_command is None:
+			await asyncio.sleep(seconds)
+			return None
+
+		result = sleep_command(seconds)
+		if inspect.isawaitable(result):
+			await result
+
+		# Always give other tasks a chance to run between presses
+		await asyncio.sleep(0)
+		return None
+
+	async def _run(self, method, *args, **kwargs):
+		result, presses = self._remote._record_presses(method, *args, **kwargs)
+
+		for press in presses:
+			if press[0] == 'sleep':
+				await self._sleep(press[1])
+			else:
+				press_args = self._remote._prepare_transmit(self._adapter.radio, *press[1], **press[2])
+				radio_start = time.perf_counter()
+				await self._adapter.multi_transmit(*press_args, **press[2])
+				if self._remote._metrics is not None:
+					self._remote._record_transmit_metrics(press[3], press_args[2], press_args[3], time.perf_counter() - radio_start)
+
+		return result
+
+	async def raw_send_button(self, button_info):
+		return await self._run('raw_send_button', button_info)
+
+	async def raw_read_button(self):
+		# The remote's radio may be swapped for a recorder while presses
+		# are recorded on the event loop, so name the real one
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self._adapter._executor, self._remote._read_button, self._adapter.radio)
+
+	async def set_brightness(self, brightness, zone = None, transition = None, easing = None):
+		return await self._run('set_brightness', brightness, zone, transition, easing)
+
+	async def set_color(self, rgb, zone = None):
+		return await self._run('set_color', rgb, zone)
+
+	async def set_temperature(self, kelvins, zone = None):
+		return await self._run('set_temperature', kelvins, zone)
+
+	async def on(self, zone = None, try_hard = False):
+		return await self._run('on', zone, try_hard = try_hard)
+
+	async def off(self, zone = None, dim = True, try_hard = False):
+		return await self._run('off', zone, dim = dim, try_hard = try_hard)
+
+	async def night(self, zone = None):
+		return await self._run('night', zone)
+
+	async def white(self, zone = None):
+		return await self._run('white', zone)
+
+	async def pair(self, zone):
+		return await self._run('pair', zone)
+
+	async def unpair(self, zone):
+		return await self._run('unpair', zone)
+
+	async def resync(self, zone = None):
+		return await self._run('resync', zone)
+
+	# Methods to query remote identity and state
+	def get_zone_ids(self):
+		return self._remote.get_zone_ids()
+
+	def get_type(self):
+		return self._remote.get_type()
+
+	def get_id(self):
+		return self._remote.get_id()
+
+	def get_message_id(self):
+		return self._remote.get_message_id()
+
+	def get_brightness_range(self):
+		return self._remote.get_brightness_range()
+
+	def get_temperature_range(self):
+		return self._remote.get_temperature_range()
@@ -0,0 +1,232 @@
+#! /usr/bin/env python3
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+from . import Remote
+
+class CaptureWriter:
+	# Append every frame a remote sends or receives to a binary capture
+	# file.  Records are buffered and flushed to disk at most every
+	# "flush_interval" seconds, so capturing does not slow sending.
+	_magic = b'LLRFCAP1'
+	_header = struct.Struct('<8sI')
+
+	# Record: timestamp, direction, protocol, syncword (count and up to
+	# 4 words), channels (count and up to 4), retries, delay and the
+	# length of the frame which follows
+	_record = struct.Struct('<dB8sB4HB4BHfH')
+	_directions = {
+		'transmit': 0,
+		'receive':  1
+	}
+	_direction_names = {code: name for name, code in _directions.items()}
+
+	def __init__(self, path, flush_interval = 1.0, time_command = None):
+		if time_command is None:
+			time_command = time.time
+
+		self._flush_interval = flush_interval
+		self._time = time_command
+
+		exists = os.path.exists(path) and os.path.getsize(path) != 0
+		self._file = open(path, 'ab')
+		if not exists:
+			self._file.write(self._header.pack(self._magic, self._record.size))
+		else:
+			with open(path, 'rb') as capture_file:
+				magic, record_size = self._header.unpack(capture_file.read(self._header.size))
+			if magic != self._magic or record_size != self._record.size:
+				self._file.close()
+				raise ValueError('Not a capture file (or an incompatible one): {}'.format(path))
+
+		# Remotes on different threads may share a writer
+		self._lock = threading.Lock()
+		self._stats = {
+			'transmit': 0,
+			'receive':  0
+		}
+		self._last_flush = self._time()
+
+		return None
+
+	def write(self, direction, protocol, syncword, channels, retries, delay, frame, timestamp = None):
+		if timestamp is None:
+			timestamp = self._time()
+
+		syncword = list(syncword)[0:4]
+		channels = list(channels)[0:4]
+
+		record = self._record.pack(
+			timestamp,
+			self._directions[direction],
+			protocol.encode('ascii'),
+			len(syncword), *(syncword + [0] * (4 - len(syncword))),
+			len(channels), *(channels + [0] * (4 - len(channels))),
+			retries,
+			delay,
+			len(frame)
+		) + bytes(frame)
+
+		# Each record is written whole, so records from different
+		# threads never interleave
+		with self._lock:
+			self._file.write(record)
+			self._stats[direction] += 1
+
+			if (self._time() - self._last_flush) >= self._flush_interval:
+				self._flush()
+
+		return None
+
+	def _flush(self):
+		self._file.flush()
+		self._last_flush = self._time()
+		return None
+
+	def flush(self):
+		with self._lock:
+			self._flush()
+		return None
+
+	def close(self):
+		with self._lock:
+			if not self._file.closed:
+				self._file.close()
+		return None
+
+	def get_stats(self):
+		with self._lock:
+			return dict(self._stats)
+
+class CaptureReader:
+	# Read a capture file through a memory map.  The offset of every
+	# record is found up front; filtering looks only at the fixed part
+	# of each record, so only the records wanted are fully decoded.
+	def __init__(self, path):
+		self._file = open(path, 'rb')
+		self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+
+		header = CaptureWriter._header
+		record = CaptureWriter._record
+		magic, record_size = header.unpack_from(self._map, 0)
+		if magic != CaptureWriter._magic or record_size != record.size:
+			self.close()
+			raise ValueError('Not a capture file (or an incompatible one): {}'.format(path))
+
+		# A record being written when the file was opened is left out
+		frame_length = struct.Struct('<H')
+		frame_length_offset = record.size - frame_length.size
+		self._offsets = []
+		offset = header.size
+		size = len(self._map)
+		while offset + record.size <= size:
+			length = frame_length.unpack_from(self._map, offset + frame_length_offset)[0]
+			if offset + record.size + length > size:
+				break
+
+			self._offsets.append(offset)
+			offset += record.size + length
+
+		return None
+
+	def __len__(self):
+		return len(self._offsets)
+
+	def __iter__(self):
+		return self.records()
+
+	def _decode(self, offset):
+		record = CaptureWriter._record
+		fields = record.unpack_from(self._map, offset)
+		syncword_count = fields[3]
+		channel_count = fields[8]
+
+		return {
+			'timestamp': fields[0],
+			'direction': CaptureWriter._direction_names[fields[1]],
+			'protocol':  fields[2].rstrip(b'\x00').decode('ascii'),
+			'syncword':  list(fields[4:4 + syncword_count]),
+			'channels':  list(fields[9:9 + channel_count]),
+			'retries':   fields[13],
+			'delay':     fields[14],
+			'frame':     bytes(self._map[offset + record.size:offset + record.size + fields[15]])
+		}
+
+	def records(self, direction = None, protocol = None, start = None, end = None, frame_prefix = None):
+		# Yield each record matching every filter given: the direction
+		# ("transmit" or "receive"), protocol, a range of timestamps and
+		# the first bytes of the frame
+		prefix = struct.Struct('<dB8s')
+		record_size = CaptureWriter._record.size
+
+		if direction is not None:
+			direction = CaptureWriter._directions[direction]
+		if protocol is not None:
+			protocol = protocol.encode('ascii').ljust(8, b'\x00')
+
+		for offset in self._offsets:
+			timestamp, record_direction, record_protocol = prefix.unpack_from(self._map, offset)
+			if direction is not None and record_direction != direction:
+				continue
+			if protocol is not None and record_protocol != protocol:
+				continue
+			if start is not None and timestamp < start:
+				continue
+			if end is not None and timestamp >= end:
+				continue
+			if frame_prefix is not None:
+				frame_offset = offset + record_size
+				if self._map[frame_offset:frame_offset + len(frame_prefix)] != frame_prefix:
+					continue
+
+			yield self._decode(offset)
+
+	def close(self):
+		if not self._map.closed:
+			self._map.close()
+		self._file.close()
+		return None
+
+def replay(records, radio, timing = 'original', speed = 1.0, sleep_command = None):
+	# Send captured frames again through a radio (or a simulated one).
+	# With "original" timing the gaps between presses are kept (divided
+	# by "speed"), with "compressed" timing each press follows the
+	# previous one as soon as it has been sent.
+	if timing not in ['original', 'compressed']:
+		raise ValueError('Invalid timing: {}'.format(timing))
+
+	if sleep_command is None:
+		sleep_command = time.sleep
+
+	stats = {
+		'presses': 0,
+		'frames':  0,
+		'waited':  0.0
+	}
+
+	previous = None
+	for record in records:
+		# Received frames were heard once on one channel
+		retries = max(1, record['retries'])
+
+		if timing == 'original' and previous is not None:
+			# The radio already spent the previous press's airtime
+			gap = record['timestamp'] - previous['timestamp']
+			gap -= max(1, previous['retries']) * previous['delay']
+			gap /= speed
+			if gap > 0:
+				sleep_command(gap)
+				stats['waited'] += gap
+
+		format_config = Remote._get_protocol(record['protocol']).parameters.get('format_config', None)
+		radio.multi_transmit(bytearray(record['frame']), record['channels'], retries, record['delay'], syncword = record['syncword'], submit_queue = None, format_config = format_config)
+
+		stats['presses'] += 1
+		stats['frames'] += retries * len(record['channels'])
+		previous = record
+
+	return stats
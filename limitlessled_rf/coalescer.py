@@ -0,0 +1,163 @@
+#! /usr/bin/env python3
+
+import concurrent.futures
+import threading
+
+class Coalescer:
+	# Queue operations for remotes, running them in order on a worker
+	# thread.  An operation which sets an attribute of a zone supersedes
+	# (drops) any still-queued operation setting the same attribute of
+	# the same zone, or of any zone if it applies to all zones.  Power
+	# operations (on/off, pairing) are never dropped and nothing is
+	# superseded across them, so their ordering is preserved.
+
+	# Method name -> (attribute, position of the zone argument); an
+	# attribute of None marks an operation which is never superseded
+	_method_attributes = {
+		'set_brightness':  ('brightness',  1),
+		'set_color':       ('color',       1),
+		'set_temperature': ('temperature', 1),
+		'night':           ('brightness',  0),
+		'white':           ('color',       0),
+		'on':              (None,          0),
+		'off':             (None,          0),
+		'pair':            (None,          0),
+		'unpair':          (None,          0),
+		'resync':          (None,          0)
+	}
+
+	def __init__(self, start = True):
+		self._pending = []
+		self._busy = False
+		self._closed = False
+		self._condition = threading.Condition()
+		self._stats = {
+			'submitted':  0,
+			'superseded': 0,
+			'executed':   0
+		}
+
+		self._thread = None
+		if start:
+			self.start()
+
+		return None
+
+	def _describe(self, method, args, kwargs):
+		attribute, zone_position = self._method_attributes.get(method, (None, 0))
+
+		if 'zone' in kwargs:
+			zone = kwargs['zone']
+		elif len(args) > zone_position:
+			zone = args[zone_position]
+		else:
+			zone = None
+
+		return attribute, zone
+
+	def start(self):
+		if self._thread is not None:
+			return False
+
+		self._thread = threading.Thread(target = self._run, name = 'limitlessled_rf-coalescer')
+		self._thread.daemon = True
+		self._thread.start()
+
+		return True
+
+	def submit(self, remote, method, *args, **kwargs):
+		attribute, zone = self._describe(method, args, kwargs)
+
+		future = concurrent.futures.Future()
+		operation = (remote, method, args, kwargs, attribute, zone, future)
+
+		with self._condition:
+			if self._closed:
+				raise RuntimeError('Coalescer is closed')
+
+			self._stats['submitted'] += 1
+
+			if attribute is not None:
+				self._supersede(remote, attribute, zone)
+
+			self._pending.append(operation)
+			self._condition.notify_all()
+
+		return future
+
+	def _supersede(self, remote, attribute, zone):
+		# Walk back from the newest pending operation, stopping at the
+		# first operation on this remote which must not be reordered
+		keep = []
+		index = len(self._pending)
+		while index > 0:
+			index -= 1
+
+			operation = self._pending[index]
+			pending_remote, pending_attribute, pending_zone = operation[0], operation[4], operation[5]
+			if pending_remote is not remote:
+				continue
+
+			overlaps = zone is None or pending_zone is None or pending_zone == zone
+			if not overlaps:
+				continue
+
+			if pending_attribute is None:
+				break
+
+			if pending_attribute != attribute:
+				continue
+
+			# Only an operation for the same zone, or one for all zones,
+			# fully replaces the pending operation
+			if zone is None or pending_zone == zone:
+				keep.append(index)
+
+		for index in keep:
+			operation = self._pending.pop(index)
+			operation[6].cancel()
+			self._stats['superseded'] += 1
+
+		return None
+
+	def _run(self):
+		while True:
+			with self._condition:
+				while len(self._pending) == 0 and not self._closed:
+					self._condition.wait()
+
+				if len(self._pending) == 0:
+					return None
+
+				remote, method, args, kwargs, attribute, zone, future = self._pending.pop(0)
+				self._busy = True
+
+			if future.set_running_or_notify_cancel():
+				try:
+					future.set_result(getattr(remote, method)(*args, **kwargs))
+				except Exception as error:
+					future.set_exception(error)
+
+			with self._condition:
+				self._busy = False
+				self._stats['executed'] += 1
+				self._condition.notify_all()
+
+	def flush(self, timeout = None):
+		# Wait for every queued operation to complete
+		with self._condition:
+			return self._condition.wait_for(lambda: len(self._pending) == 0 and not self._busy, timeout)
+
+	def close(self, wait = True):
+		with self._condition:
+			self._closed = True
+			self._condition.notify_all()
+
+		if wait and self._thread is not None:
+			self._thread.join()
+
+		return None
+
+	def get_stats(self):
+		with self._condition:
+			return dict(self._stats)
@@ -0,0 +1,209 @@
+#! /usr/bin/env python3
+
+# NumPy is optional, it is only used to speed up batch conversions
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+def rgb_to_hue(r, g, b):
+	r = r / 255.0
+	g = g / 255.0
+	b = b / 255.0
+
+	cmax = max(r, max(g, b))
+	cmin = min(r, min(g, b))
+	diff = cmax - cmin
+
+	if cmax == cmin:
+		h = 0
+	elif cmax == r:
+		h = (60 * ((g - b) / diff) + 360) % 360
+	elif cmax == g:
+		h = (60 * ((b - r) / diff) + 120) % 360
+	elif cmax == b:
+		h = (60 * ((r - g) / diff) + 240) % 360
+
+	return h
+
+def hue_to_color(h, offset = 26):
+	# Convert the hue into a LimitlessLED value which is really just
+	# the position along the color strip, offset
+	color = ((h / 360.0) * 255.0) + offset
+	color = color % 256
+
+	color = int(color + 0.5) % 256
+
+	return color
+
+def color_to_rgb(color, offset = 26):
+	# The fully saturated RGB value at a LimitlessLED color value, the
+	# inverse of hue_to_color()
+	h = (((color - offset) % 256) / 255.0) * 360.0
+	sector = int(h / 60) % 6
+	fraction = (h / 60) - int(h / 60)
+
+	rising = int((fraction * 255) + 0.5)
+	falling = 255 - rising
+
+	r, g, b = [
+		(255, rising, 0),
+		(falling, 255, 0),
+		(0, 255, rising),
+		(0, falling, 255),
+		(rising, 0, 255),
+		(255, 0, falling)
+	][sector]
+
+	return (r << 16) | (g << 8) | b
+
+def _unpack_rgb_values(rgb_values):
+	# Buffers are packed 24-bit RGB (3 bytes per value), anything else
+	# is a sequence of 0xRRGGBB integers
+	if isinstance(rgb_values, (bytes, bytearray, memoryview)):
+		data = memoryview(rgb_values).cast('B')
+		if len(data) % 3 != 0:
+			raise ValueError('Packed RGB values must be a multiple of 3 bytes long')
+
+		if numpy is not None:
+			data = numpy.frombuffer(data, dtype = numpy.uint8).reshape(-1, 3).astype(numpy.uint32)
+			return (data[:, 0] << 16) | (data[:, 1] << 8) | data[:, 2]
+
+		return [(data[index] << 16) | (data[index + 1] << 8) | data[index + 2] for index in range(0, len(data), 3)]
+
+	if numpy is not None:
+		return numpy.asarray(rgb_values, dtype = numpy.uint32)
+
+	return rgb_values
+
+def _rgb_to_color_batch_numpy(rgb_values, offset):
+	r_int = (rgb_values >> 16) & 0xff
+	g_int = (rgb_values >>  8) & 0xff
+	b_int =  rgb_values        & 0xff
+
+	whites = (r_int == g_int) & (g_int == b_int)
+
+	r = r_int / 255.0
+	g = g_int / 255.0
+	b = b_int / 255.0
+
+	cmax = numpy.maximum(r, numpy.maximum(g, b))
+	cmin = numpy.minimum(r, numpy.minimum(g, b))
+	diff = cmax - cmin
+
+	# Evaluate the same expressions as rgb_to_hue, in the same order,
+	# so that the results are identical
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		hue_r = (60 * ((g - b) / diff) + 360) % 360
+		hue_g = (60 * ((b - r) / diff) + 120) % 360
+		hue_b = (60 * ((r - g) / diff) + 240) % 360
+
+	h = numpy.where(cmax == r, hue_r, numpy.where(cmax == g, hue_g, hue_b))
+	h = numpy.where(cmax == cmin, 0.0, h)
+
+	colors = ((h / 360.0) * 255.0) + offset
+	colors = colors % 256
+	colors = numpy.floor(colors + 0.5).astype(numpy.uint32) & 0xff
+
+	return colors.astype(numpy.uint8), whites, r_int.astype(numpy.uint8)
+
+def rgb_to_color_batch(rgb_values, offset = 26, lookup_table = None):
+	# Convert many RGB values at once, returning the device color
+	# bytes, whether each value is really a shade of white, and the
+	# brightness of those shades of white.  With NumPy these are
+	# arrays, otherwise they are bytearrays.
+	rgb_values = _unpack_rgb_values(rgb_values)
+
+	if lookup_table is not None:
+		return lookup_table.convert(rgb_values)
+
+	if numpy is not None:
+		return _rgb_to_color_batch_numpy(rgb_values, offset)
+
+	colors = bytearray(len(rgb_values))
+	whites = bytearray(len(rgb_values))
+	brightnesses = bytearray(len(rgb_values))
+	for index, rgb in enumerate(rgb_values):
+		r = (rgb >> 16) & 0xff
+		g = (rgb >>  8) & 0xff
+		b =  rgb        & 0xff
+
+		colors[index] = hue_to_color(rgb_to_hue(r, g, b), offset) & 0xff
+		if r == g and g == b:
+			whites[index] = 1
+		brightnesses[index] = r
+
+	return colors, whites, brightnesses
+
+class ColorLookupTable:
+	# Precomputed color bytes for RGB values quantized to a number of
+	# bits per channel, for O(1) conversions
+	def __init__(self, bits = 6, offset = 26):
+		if bits < 1 or bits > 8:
+			raise ValueError('bits must be between 1 and 8')
+
+		self._bits = bits
+		self._offset = offset
+		self._shift = 8 - bits
+		self._mask = (1 << bits) - 1
+
+		# Convert the value at the middle of each quantization step
+		levels = 1 << bits
+		representatives = []
+		for level in range(levels):
+			representatives.append((level << self._shift) | ((1 << self._shift) >> 1))
+
+		rgb_values = []
+		for r in representatives:
+			for g in representatives:
+				for b in representatives:
+					rgb_values.append((r << 16) | (g << 8) | b)
+
+		colors = rgb_to_color_batch(rgb_values, offset)[0]
+		if numpy is not None:
+			self._table = numpy.asarray(colors, dtype = numpy.uint8)
+		else:
+			self._table = bytes(colors)
+
+		return None
+
+	def _index(self, rgb):
+		r = ((rgb >> 16) & 0xff) >> self._shift
+		g = ((rgb >>  8) & 0xff) >> self._shift
+		b = ( rgb        & 0xff) >> self._shift
+
+		return (((r << self._bits) | g) << self._bits) | b
+
+	def get_offset(self):
+		return self._offset
+
+	def lookup(self, rgb):
+		return int(self._table[self._index(rgb)])
+
+	def convert(self, rgb_values):
+		rgb_values = _unpack_rgb_values(rgb_values)
+
+		if numpy is not None:
+			r = (rgb_values >> 16) & 0xff
+			g = (rgb_values >>  8) & 0xff
+			b =  rgb_values        & 0xff
+
+			index = (((r >> self._shift) << (2 * self._bits)) | ((g >> self._shift) << self._bits) | (b >> self._shift))
+			whites = (r == g) & (g == b)
+
+			return self._table[index], whites, r.astype(numpy.uint8)
+
+		colors = bytearray(len(rgb_values))
+		whites = bytearray(len(rgb_values))
+		brightnesses = bytearray(len(rgb_values))
+		for index, rgb in enumerate(rgb_values):
+			r = (rgb >> 16) & 0xff
+			g = (rgb >>  8) & 0xff
+			b =  rgb        & 0xff
+
+			colors[index] = self._table[self._index(rgb)]
+			if r == g and g == b:
+				whites[index] = 1
+			brightnesses[index] = r
+
+		return colors, whites, brightnesses
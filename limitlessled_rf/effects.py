@@ -0,0 +1,228 @@
+#! /usr/bin/env python3
+
+import colorsys
+import math
+import random
+
+class EffectEngine:
+	# Run an effect -- a generator of target states, one per frame --
+	# against a zone of a remote at a requested frame rate.  After each
+	# state is sent, every frame which fell due while the radio was busy
+	# is merged into the next state sent, so a slow radio drops frames
+	# instead of falling further and further behind.  Frames are taken
+	# up to when sending is expected to finish, so what the bulbs show
+	# is not late by the radio's airtime.
+
+	# State key -> order it is applied in
+	_state_order = ['on', 'night', 'color', 'temperature', 'brightness']
+
+	def __init__(self, remote, zone = None, frame_rate = 10.0):
+		self._remote = remote
+		self._zone = zone
+		self._frame_rate = frame_rate
+		self._stopped = False
+
+		# How long sending a state takes, measured while running
+		self._send_time = 0.0
+
+		self._stats = {
+			'frames':   0,
+			'sent':     0,
+			'merged':   0,
+			'commands': 0
+		}
+
+		return None
+
+	def _apply(self, key, value):
+		remote = self._remote
+		zone = self._zone
+
+		if key == 'on':
+			if value:
+				return remote.on(zone)
+			return remote.off(zone, dim = False)
+		elif key == 'night':
+			if value:
+				return remote.night(zone)
+			return True
+		elif key == 'color':
+			return remote.set_color(value, zone)
+		elif key == 'temperature':
+			return remote.set_temperature(value, zone)
+		elif key == 'brightness':
+			return remote.set_brightness(value, zone)
+
+		return False
+
+	def _send(self, state, sent_state):
+		# Send only what differs from what was last sent
+		start_time = self._remote._time()
+		for key in self._state_order:
+			if key not in state:
+				continue
+
+			if key in sent_state and sent_state[key] == state[key]:
+				continue
+
+			self._apply(key, state[key])
+			self._stats['commands'] += 1
+
+			sent_state[key] = state[key]
+
+		# Follow changes in how long sending takes
+		elapsed = self._remote._time() - start_time
+		self._send_time = (self._send_time * 0.8) + (elapsed * 0.2)
+
+		return None
+
+	def run(self, effect, duration = None, **parameters):
+		# Run until the effect ends, "duration" seconds have passed or
+		# "stop" is called; "effect" is called with the frame rate and
+		# "parameters" to create the generator
+		frames = effect(self._frame_rate, **parameters)
+		frame_interval = 1.0 / self._frame_rate
+
+		# Frames this close to being due are treated as due, so that
+		# rounding never leaves a wait too short to advance the clock
+		tolerance = frame_interval / 1000.0
+
+		self._stopped = False
+		for key in self._stats:
+			self._stats[key] = 0
+
+		# Until it has been measured, assume sending a state takes the
+		# configured airtime of a single press, on every channel
+		config = self._remote._config
+		self._send_time = config['retries'] * config['delay'] * len(config['channels'])
+
+		start_time = self._remote._time()
+		frame = 0
+		sent_state = {}
+
+		while not self._stopped:
+			now = self._remote._time() - start_time
+			if duration is not None and now >= duration:
+				break
+
+			# Take every frame which is due by the time this state will
+			# have been sent, merging them so that only the latest value
+			# of each key is sent
+			horizon = now + self._send_time
+			if duration is not None:
+				horizon = min(horizon, duration)
+
+			state = {}
+			due = 0
+			finished = False
+			while (frame * frame_interval) <= (horizon + tolerance):
+				try:
+					state.update(next(frames))
+				except StopIteration:
+					finished = True
+					break
+
+				frame += 1
+				due += 1
+
+			if due != 0:
+				self._stats['frames'] += due
+				self._stats['merged'] += due - 1
+				self._stats['sent'] += 1
+				self._send(state, sent_state)
+
+			if finished:
+				break
+
+			# Wait for the next frame, if sending has not already
+			# taken past it
+			wait = (frame * frame_interval) - (self._remote._time() - start_time)
+			if duration is not None:
+				wait = min(wait, duration - (self._remote._time() - start_time))
+			if wait > tolerance:
+				self._remote._sleep(wait)
+
+		return self.get_stats()
+
+	def stop(self):
+		# Stop a running effect after the state being sent
+		self._stopped = True
+		return None
+
+	def get_stats(self):
+		stats = dict(self._stats)
+		stats['send_time'] = self._send_time
+		if stats['frames'] != 0:
+			stats['dropped_fraction'] = stats['merged'] / stats['frames']
+		else:
+			stats['dropped_fraction'] = 0.0
+
+		return stats
+
+def _hsv_to_rgb(hue, saturation = 1.0, value = 1.0):
+	r, g, b = colorsys.hsv_to_rgb(hue % 1.0, saturation, value)
+	return (int(r * 255 + 0.5) << 16) | (int(g * 255 + 0.5) << 8) | int(b * 255 + 0.5)
+
+def color_cycle(frame_rate, period = 10.0, brightness = None):
+	# Go around the color wheel once every "period" seconds
+	frame = 0
+	while True:
+		state = {'color': _hsv_to_rgb(frame / (period * frame_rate))}
+		if brightness is not None and frame == 0:
+			state['brightness'] = brightness
+
+		yield state
+		frame += 1
+
+def pulse(frame_rate, period = 2.0, low = 1, high = 255, color = None):
+	# Fade the brightness between "low" and "high" and back every
+	# "period" seconds
+	frame = 0
+	while True:
+		phase = (1 - math.cos(2 * math.pi * frame / (period * frame_rate))) / 2
+		state = {'brightness': int(low + ((high - low) * phase) + 0.5)}
+		if color is not None and frame == 0:
+			state['color'] = color
+
+		yield state
+		frame += 1
+
+def candle(frame_rate, brightness = 180, flicker = 60, color = 0xFF9329, seed = None):
+	# A warm color whose brightness wanders randomly around "brightness"
+	# by up to "flicker", pulled back towards it
+	generator = random.Random(seed)
+	value = float(brightness)
+	step = flicker / math.sqrt(frame_rate)
+
+	yield {'color': color, 'brightness': brightness}
+	while True:
+		value += generator.uniform(-step, step) + ((brightness - value) * 0.2)
+		value = max(brightness - flicker, min(brightness + flicker, value))
+		yield {'brightness': max(1, min(255, int(value + 0.5)))}
+
+def strobe(frame_rate, bpm = 120.0, beats = None, flash = None):
+	# Turn the bulbs on for "flash" seconds (by default one frame) at
+	# each beat, either every beat at "bpm" or at each of the times (in
+	# seconds from the start) in "beats", for example from a beat tracker
+	if flash is None:
+		flash = 1.0 / frame_rate
+
+	if beats is not None:
+		beats = iter(beats)
+		next_beat = next(beats, None)
+
+	beat = None
+	frame = 0
+	while True:
+		now = frame / frame_rate
+
+		if beats is None:
+			beat = math.floor(now * bpm / 60.0) * 60.0 / bpm
+		else:
+			# Move on to the latest beat which has started
+			while next_beat is not None and next_beat <= now:
+				beat = next_beat
+				next_beat = next(beats, None)
+
+		yield {'on': beat is not None and now < (beat + flash)}
+		frame += 1
@@ -0,0 +1,262 @@
+#! /usr/bin/env python3
+
+import selectors
+import socket
+import threading
+import time
+
+from . import color
+from .coalescer import Coalescer
+
+class Gateway:
+	# A UDP server speaking the LimitlessLED WiFi bridge (v3) protocol,
+	# translating each command into calls on a Remote.  Each port is
+	# one remote, as with the bridge.  Sockets are non-blocking, repeated
+	# copies of a packet are collapsed, and the resulting calls are fed
+	# through one coalescing queue per radio so that transmitting never
+	# blocks receiving.
+
+	# Command byte -> (method, zone); color and brightness apply to the
+	# zone most recently turned on, as with the bridge
+	_rgbw_commands = {
+		0x42: ('on', None),
+		0x41: ('off', None),
+		0x45: ('on', 1),
+		0x46: ('off', 1),
+		0x47: ('on', 2),
+		0x48: ('off', 2),
+		0x49: ('on', 3),
+		0x4A: ('off', 3),
+		0x4B: ('on', 4),
+		0x4C: ('off', 4),
+		0xC2: ('white', None),
+		0xC5: ('white', 1),
+		0xC7: ('white', 2),
+		0xC9: ('white', 3),
+		0xCB: ('white', 4),
+		0xC1: ('night', None),
+		0xC6: ('night', 1),
+		0xC8: ('night', 2),
+		0xCA: ('night', 3),
+		0xCC: ('night', 4),
+		0x40: ('set_color', 'selected'),
+		0x4E: ('set_brightness', 'selected')
+	}
+	_cct_commands = {
+		0x35: ('on', None),
+		0x39: ('off', None),
+		0x38: ('on', 1),
+		0x3B: ('off', 1),
+		0x3D: ('on', 2),
+		0x33: ('off', 2),
+		0x37: ('on', 3),
+		0x3A: ('off', 3),
+		0x32: ('on', 4),
+		0x36: ('off', 4),
+		0xB5: ('max_brightness', None),
+		0xB8: ('max_brightness', 1),
+		0xBD: ('max_brightness', 2),
+		0xB7: ('max_brightness', 3),
+		0xB2: ('max_brightness', 4),
+		0xB9: ('night', None),
+		0xBB: ('night', 1),
+		0xB3: ('night', 2),
+		0xBA: ('night', 3),
+		0xB6: ('night', 4),
+		0x3C: ('brightness_up', 'selected'),
+		0x34: ('brightness_down', 'selected'),
+		0x3E: ('temperature_up', 'selected'),
+		0x3F: ('temperature_down', 'selected')
+	}
+
+	def __init__(self, remotes, host = '0.0.0.0', burst_window = 0.1, time_command = None):
+		if time_command is None:
+			time_command = time.monotonic
+
+		self._time = time_command
+		self._burst_window = burst_window
+		self._selector = selectors.DefaultSelector()
+		self._ports = {}
+		self._coalescers = {}
+		self._selected_zones = {}
+		self._recent_packets = {}
+
+		# Calls complete on the coalescers' threads
+		self._lock = threading.Lock()
+		self._stats = {
+			'packets':     0,
+			'collapsed':   0,
+			'unsupported': 0,
+			'dispatched':  0,
+			'completed':   0,
+			'latency_sum': 0.0,
+			'latency_max': 0.0
+		}
+
+		for port, remote in remotes.items():
+			listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			listener.setblocking(False)
+			listener.bind((host, port))
+
+			# A port of 0 binds to any free port
+			port = listener.getsockname()[1]
+			self._ports[port] = remote
+			self._selected_zones[port] = None
+			self._selector.register(listener, selectors.EVENT_READ, port)
+
+			# One queue per radio
+			radio_key = id(remote._real_radio)
+			if radio_key not in self._coalescers:
+				self._coalescers[radio_key] = Coalescer()
+
+		return None
+
+	def get_ports(self):
+		return dict(self._ports)
+
+	def get_stats(self):
+		with self._lock:
+			stats = dict(self._stats)
+		if stats['completed'] != 0:
+			stats['latency_average'] = stats['latency_sum'] / stats['completed']
+		else:
+			stats['latency_average'] = None
+
+		return stats
+
+	def _translate(self, port, remote, packet):
+		# Returns (method, args) for a packet, or None if it is not
+		# understood
+		if len(packet) < 2:
+			return None
+
+		command = packet[0]
+		value = packet[1]
+
+		if remote.get_type() in ['cct', 'lyh_cct']:
+			commands = self._cct_commands
+		else:
+			commands = self._rgbw_commands
+
+		if command not in commands:
+			return None
+
+		method, zone = commands[command]
+		if zone == 'selected':
+			zone = self._selected_zones[port]
+		elif method in ['on', 'white', 'night', 'max_brightness']:
+			self._selected_zones[port] = zone
+
+		if method == 'set_color':
+			return ('set_color', (color.color_to_rgb(value), zone))
+		elif method == 'set_brightness':
+			# The bridge uses values from 2 to 27
+			brightness = max(2, min(27, value)) - 2
+			brightness = int((brightness * 254 / 25) + 1.5)
+			return ('set_brightness', (brightness, zone))
+		elif method == 'max_brightness':
+			return ('set_brightness', (255, zone))
+		elif method in ['brightness_up', 'brightness_down', 'temperature_up', 'temperature_down']:
+			button_info = {'button': method}
+			if zone is not None:
+				button_info['zone'] = zone
+			return ('raw_send_button', (button_info,))
+		elif method == 'off':
+			return ('off', (zone,), {'dim': False})
+
+		return (method, (zone,))
+
+	def _count(self, name):
+		with self._lock:
+			self._stats[name] += 1
+		return None
+
+	def _handle_packet(self, port, packet, now):
+		self._count('packets')
+
+		# Clients send each command several times in quick succession;
+		# the window starts at the first copy and is not extended by the
+		# others, so commands repeated on purpose still get through
+		recent_key = (port, packet)
+		burst_start = self._recent_packets.get(recent_key)
+		if burst_start is not None and (now - burst_start) <= self._burst_window:
+			self._count('collapsed')
+			return None
+
+		self._recent_packets[recent_key] = now
+
+		remote = self._ports[port]
+		call = self._translate(port, remote, packet)
+		if call is None:
+			self._count('unsupported')
+			return None
+
+		method, args = call[0], call[1]
+		kwargs = {}
+		if len(call) > 2:
+			kwargs = call[2]
+
+		coalescer = self._coalescers[id(remote._real_radio)]
+		future = coalescer.submit(remote, method, *args, **kwargs)
+		self._count('dispatched')
+
+		def completed(future):
+			if future.cancelled():
+				return None
+
+			latency = self._time() - now
+			with self._lock:
+				self._stats['completed'] += 1
+				self._stats['latency_sum'] += latency
+				self._stats['latency_max'] = max(self._stats['latency_max'], latency)
+
+		future.add_done_callback(completed)
+
+		return None
+
+	def _expire_recent_packets(self, now):
+		for key, burst_start in list(self._recent_packets.items()):
+			if (now - burst_start) > self._burst_window:
+				del self._recent_packets[key]
+
+		return None
+
+	def poll(self, timeout = 0):
+		# Handle every packet waiting (or arriving within "timeout")
+		for key, events in self._selector.select(timeout):
+			listener = key.fileobj
+			while True:
+				try:
+					packet, address = listener.recvfrom(64)
+				except (BlockingIOError, InterruptedError):
+					break
+
+				self._handle_packet(key.data, packet, self._time())
+
+		self._expire_recent_packets(self._time())
+
+		return None
+
+	def run(self, duration = None, poll_interval = 0.5):
+		start_time = self._time()
+		while duration is None or (self._time() - start_time) < duration:
+			self.poll(poll_interval)
+
+		return None
+
+	def flush(self, timeout = None):
+		for coalescer in self._coalescers.values():
+			coalescer.flush(timeout)
+
+		return None
+
+	def close(self):
+		for key in list(self._selector.get_map().values()):
+			self._selector.unregister(key.fileobj)
+			key.fileobj.close()
+		self._selector.close()
+
+		for coalescer in self._coalescers.values():
+			coalescer.close()
+
+		return None
@@ -0,0 +1,215 @@
+#! /usr/bin/env python3
+
+import collections
+import os
+import socket
+import threading
+import time
+
+class _Span:
+	def __init__(self, metrics, name, attributes):
+		self._metrics = metrics
+		self.name = name
+		self.attributes = attributes
+		self.parent = None
+		self.depth = 0
+		self.start = None
+		self.end = None
+		self.presses = 0
+		self.airtime = 0.0
+		return None
+
+	def __enter__(self):
+		stack = self._metrics._get_span_stack()
+		if len(stack) != 0:
+			self.parent = stack[-1]
+			self.depth = self.parent.depth + 1
+		stack.append(self)
+
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, exception_type, exception_value, traceback):
+		self.end = time.perf_counter()
+		self._metrics._get_span_stack().pop()
+		self._metrics._finish_span(self)
+		return False
+
+	def to_dict(self):
+		span = {
+			'name':       self.name,
+			'attributes': dict(self.attributes),
+			'depth':      self.depth,
+			'parent':     None,
+			'start':      self.start,
+			'duration':   self.end - self.start,
+			'presses':    self.presses,
+			'airtime':    self.airtime
+		}
+		if self.parent is not None:
+			span['parent'] = self.parent.name
+
+		return span
+
+class Metrics:
+	# Counters, histograms and nested trace spans describing what
+	# remotes are doing.  A remote only records anything if it was
+	# given an instance of this as its "metrics" config key.
+	default_buckets = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0, 60.0]
+
+	def __init__(self, buckets = None, max_spans = 1000, span_callback = None):
+		if buckets is None:
+			buckets = self.default_buckets
+
+		self._buckets = sorted(buckets)
+		self._lock = threading.Lock()
+		self._counters = {}
+		self._histograms = {}
+		self._spans = collections.deque(maxlen = max_spans)
+		self._span_callback = span_callback
+		self._local = threading.local()
+
+		return None
+
+	def _key(self, name, labels):
+		if labels is None:
+			return (name, ())
+
+		return (name, tuple(sorted(labels.items())))
+
+	def increment(self, name, labels = None, value = 1):
+		key = self._key(name, labels)
+		with self._lock:
+			self._counters[key] = self._counters.get(key, 0) + value
+		return None
+
+	def observe(self, name, value, labels = None):
+		key = self._key(name, labels)
+		with self._lock:
+			histogram = self._histograms.get(key)
+			if histogram is None:
+				histogram = [[0] * len(self._buckets), 0.0, 0]
+				self._histograms[key] = histogram
+
+			for index, bucket in enumerate(self._buckets):
+				if value <= bucket:
+					histogram[0][index] += 1
+			histogram[1] += value
+			histogram[2] += 1
+
+		return None
+
+	def get_counter(self, name, labels = None):
+		with self._lock:
+			return self._counters.get(self._key(name, labels), 0)
+
+	def _get_span_stack(self):
+		stack = getattr(self._local, 'spans', None)
+		if stack is None:
+			stack = []
+			self._local.spans = stack
+		return stack
+
+	def span(self, name, **attributes):
+		return _Span(self, name, attributes)
+
+	def record_press(self, retries, frames, airtime):
+		# Attribute a press to every span that is open on this thread
+		for span in self._get_span_stack():
+			span.presses += 1
+			span.airtime += airtime
+		return None
+
+	def _finish_span(self, span):
+		labels = {'method': span.name}
+		self.increment('limitlessled_rf_api_calls_total', labels)
+		self.increment('limitlessled_rf_api_airtime_seconds_total', labels, span.airtime)
+		self.observe('limitlessled_rf_api_seconds', span.end - span.start, labels)
+
+		with self._lock:
+			self._spans.append(span)
+
+		if self._span_callback is not None:
+			self._span_callback(span)
+
+		return None
+
+	def get_spans(self):
+		with self._lock:
+			return [span.to_dict() for span in self._spans]
+
+	def _format_labels(self, labels, extra = None):
+		labels = list(labels)
+		if extra is not None:
+			labels.append(extra)
+
+		if len(labels) == 0:
+			return ''
+
+		formatted = []
+		for label_name, label_value in labels:
+			label_value = str(label_value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+			formatted.append('{}="{}"'.format(label_name, label_value))
+
+		return '{' + ','.join(formatted) + '}'
+
+	def render_prometheus(self):
+		lines = []
+		with self._lock:
+			counters = sorted(self._counters.items())
+			histograms = sorted(self._histograms.items())
+
+		last_name = None
+		for (name, labels), value in counters:
+			if name != last_name:
+				lines.append('# TYPE {} counter'.format(name))
+				last_name = name
+			lines.append('{}{} {}'.format(name, self._format_labels(labels), value))
+
+		last_name = None
+		for (name, labels), (bucket_counts, total, count) in histograms:
+			if name != last_name:
+				lines.append('# TYPE {} histogram'.format(name))
+				last_name = name
+			for bucket, bucket_count in zip(self._buckets, bucket_counts):
+				lines.append('{}_bucket{} {}'.format(name, self._format_labels(labels, ('le', repr(float(bucket)))), bucket_count))
+			lines.append('{}_bucket{} {}'.format(name, self._format_labels(labels, ('le', '+Inf')), count))
+			lines.append('{}_sum{} {}'.format(name, self._format_labels(labels), total))
+			lines.append('{}_count{} {}'.format(name, self._format_labels(labels), count))
+
+		return '\n'.join(lines) + '\n'
+
+class PrometheusExporter:
+	# Write metrics in the Prometheus text format, either to a file
+	# (replaced atomically, e.g. for a textfile collector) or to a
+	# stream socket (a UNIX socket path or a (host, port) tuple)
+	def __init__(self, metrics, path = None, address = None):
+		if path is None and address is None:
+			raise ValueError('Either a path or an address must be specified')
+
+		self._metrics = metrics
+		self._path = path
+		self._address = address
+		return None
+
+	def export(self):
+		text = self._metrics.render_prometheus()
+
+		if self._path is not None:
+			temporary_path = '{}.{}.tmp'.format(self._path, os.getpid())
+			with open(temporary_path, 'w') as output:
+				output.write(text)
+			os.replace(temporary_path, self._path)
+
+		if self._address is not None:
+			if isinstance(self._address, str):
+				connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			else:
+				connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			try:
+				connection.connect(self._address)
+				connection.sendall(text.encode('utf-8'))
+			finally:
+				connection.close()
+
+		return True
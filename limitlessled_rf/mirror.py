@@ -0,0 +1,190 @@
+#! /usr/bin/env python3
+
+import time
+
+from . import Remote
+
+class StateMirror:
+	# A model of what state the bulbs paired to some remotes are in,
+	# built from the presses heard from those remotes.  Stepped values
+	# are tracked as the range they could be in, which narrows to a
+	# single value once the steps reach an extreme.
+	_stepped_attributes = {
+		'brightness':  'brightness_range',
+		'temperature': 'temperature_output_range'
+	}
+
+	def __init__(self, remote_type, remote_ids = None, half_life = 3600.0, time_command = None):
+		if time_command is None:
+			time_command = time.monotonic
+
+		# Aliases resolve to the protocol they name
+		protocol = Remote._get_protocol(remote_type)
+		self._type = protocol.name
+		self._config = protocol.parameters
+		self._zones = list(self._config.get('zones', [1, 2, 3, 4]))
+		self._remote_ids = remote_ids
+		self._half_life = half_life
+		self._time = time_command
+
+		# (remote ID, zone) -> {attribute: [value, updated]}; stepped
+		# values are stored as a [low, high] range
+		self._states = {}
+
+		return None
+
+	def _get_zone_state(self, remote_id, zone):
+		key = (remote_id, zone)
+		state = self._states.get(key)
+		if state is None:
+			state = {}
+			self._states[key] = state
+
+		return state
+
+	def _set(self, state, attribute, value, now):
+		state[attribute] = [value, now]
+		return None
+
+	def _step(self, state, attribute, direction, now):
+		value_min, value_max = self._config[self._stepped_attributes[attribute]]
+
+		value_range = state.get(attribute, [[value_min, value_max]])[0]
+		low = max(value_min, min(value_max, value_range[0] + direction))
+		high = max(value_min, min(value_max, value_range[1] + direction))
+
+		state[attribute] = [[low, high], now]
+		return None
+
+	def consume(self, event, timestamp = None):
+		remote_id = event.get('remote_id', None)
+		if remote_id is None:
+			return False
+
+		if self._remote_ids is not None and remote_id not in self._remote_ids:
+			return False
+
+		if timestamp is None:
+			timestamp = event.get('timestamp', None)
+		if timestamp is None:
+			timestamp = self._time()
+
+		button = event['button']
+		zone = event.get('zone', None)
+
+		# Color on rgbw remotes is addressed to a zone via the
+		# brightness byte
+		if self._type == 'rgbw' and button == 'zone_set_color':
+			zone = event['brightness'] & 0b111
+			if zone == 0:
+				zone = None
+
+		if button.startswith('zone_'):
+			button = button[5:]
+
+		if zone is None:
+			zones = self._zones
+		else:
+			zones = [zone]
+
+		for zone in zones:
+			self._apply(self._get_zone_state(remote_id, zone), button, event, timestamp)
+
+		return True
+
+	def _apply(self, state, button, event, now):
+		if button == 'on':
+			self._set(state, 'on', True, now)
+			self._set(state, 'night', False, now)
+		elif button == 'off':
+			self._set(state, 'on', False, now)
+		elif button == 'night':
+			brightness_min = self._config['brightness_range'][0]
+			self._set(state, 'on', True, now)
+			self._set(state, 'night', True, now)
+			self._set(state, 'brightness', [brightness_min, brightness_min], now)
+		elif button == 'max':
+			brightness_max = self._config['brightness_range'][1]
+			self._set(state, 'night', False, now)
+			self._set(state, 'brightness', [brightness_max, brightness_max], now)
+		elif button == 'white':
+			self._set(state, 'mode', 'white', now)
+		elif button == 'set_brightness':
+			self._set(state, 'night', False, now)
+			self._set(state, 'brightness', [event['brightness'], event['brightness']], now)
+		elif button == 'set_color':
+			self._set(state, 'mode', 'color', now)
+			self._set(state, 'color', event['color'], now)
+		elif button == 'set_temperature':
+			# Remotes which set the temperature directly also go to white
+			# this way
+			self._set(state, 'mode', 'white', now)
+			self._set(state, 'temperature', [event['temperature'], event['temperature']], now)
+		elif button == 'set_saturation':
+			self._set(state, 'saturation', event['saturation'], now)
+		elif button == 'brightness_up':
+			self._step(state, 'brightness', 1, now)
+		elif button == 'brightness_down':
+			self._step(state, 'brightness', -1, now)
+		elif button == 'temperature_up':
+			self._step(state, 'temperature', 1, now)
+		elif button == 'temperature_down':
+			self._step(state, 'temperature', -1, now)
+
+		return None
+
+	def get_state(self, remote_id, zone):
+		# The believed value of each attribute (None if unknown), along
+		# with how confident that belief is (from 0 to 1, decaying with
+		# age) and how old it is
+		now = self._time()
+		state = self._states.get((remote_id, zone), {})
+
+		result = {
+			'values':     {},
+			'confidence': {},
+			'age':        {}
+		}
+		for attribute in ['on', 'night', 'mode', 'color', 'saturation', 'brightness', 'temperature']:
+			if attribute not in state:
+				result['values'][attribute] = None
+				result['confidence'][attribute] = 0.0
+				result['age'][attribute] = None
+				continue
+
+			value, updated = state[attribute]
+			age = now - updated
+			confidence = 0.5 ** (age / self._half_life)
+
+			# Stepped values are only known once their range narrows
+			if attribute in self._stepped_attributes:
+				value_min, value_max = self._config[self._stepped_attributes[attribute]]
+				low, high = value
+				confidence *= 1.0 - ((high - low) / (value_max - value_min))
+				if low == high:
+					value = low
+				else:
+					value = None
+
+			result['values'][attribute] = value
+			result['confidence'][attribute] = confidence
+			result['age'][attribute] = age
+
+		return result
+
+	def apply_to_remote(self, remote, remote_id = None, min_confidence = 0.9):
+		# Seed a Remote's tracked state (see "track_state") with what is
+		# confidently known, so that it only sends the changes needed
+		if remote_id is None:
+			remote_id = remote.get_id()
+
+		for zone in self._zones:
+			state = self.get_state(remote_id, zone)
+			for attribute in ['brightness', 'temperature', 'mode']:
+				value = state['values'][attribute]
+				if value is None or state['confidence'][attribute] < min_confidence:
+					continue
+
+				remote._set_tracked_state(attribute, zone, value)
+
+		return None
@@ -0,0 +1,132 @@
+#! /usr/bin/env python3
+
+import concurrent.futures
+import threading
+
+class RadioPool:
+	# Run calls to remotes on a pool of radios, each with its own worker
+	# thread, so that presses on different radios go out at the same
+	# time.  A remote's calls run in order: while one is outstanding,
+	# the next goes to the same radio.
+	_assignments = ['least_loaded', 'remote', 'protocol']
+
+	def __init__(self, radios, assignment = 'least_loaded', radio_map = None):
+		if assignment not in self._assignments:
+			raise ValueError('Invalid assignment: {}'.format(assignment))
+
+		self._radios = list(radios)
+		if len(self._radios) == 0:
+			raise ValueError('A radio pool needs at least one radio')
+
+		self._assignment = assignment
+
+		# Remote (for "remote") or remote type (for "protocol") ->
+		# radio; anything not listed is spread across the radios as it
+		# is first seen
+		self._assigned = {}
+		if radio_map is not None:
+			for key, radio in radio_map.items():
+				self._assigned[key] = self._radios.index(radio)
+
+		self._executors = []
+		for index in range(len(self._radios)):
+			self._executors.append(concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'limitlessled_rf-radio-{}'.format(index)))
+
+		# Calls queued or running per radio, and for each remote with
+		# calls outstanding, the radio they are on and how many
+		self._loads = [0] * len(self._radios)
+		self._affinity = {}
+		self._closed = False
+		self._condition = threading.Condition()
+		self._stats = [{'submitted': 0, 'executed': 0} for radio in self._radios]
+
+		return None
+
+	def _least_loaded(self):
+		return min(range(len(self._radios)), key = lambda index: self._loads[index])
+
+	def _choose_radio(self, remote):
+		affinity = self._affinity.get(remote)
+		if affinity is not None:
+			return affinity[0]
+
+		if self._assignment == 'least_loaded':
+			return self._least_loaded()
+
+		if self._assignment == 'remote':
+			key = remote
+		else:
+			key = remote.get_type()
+
+		if key not in self._assigned:
+			# A remote already using one of the radios stays on it
+			if self._assignment == 'remote' and remote._real_radio in self._radios:
+				self._assigned[key] = self._radios.index(remote._real_radio)
+			else:
+				self._assigned[key] = len(self._assigned) % len(self._radios)
+
+		return self._assigned[key]
+
+	def submit(self, remote, method, *args, **kwargs):
+		with self._condition:
+			if self._closed:
+				raise RuntimeError('RadioPool is closed')
+
+			index = self._choose_radio(remote)
+			self._loads[index] += 1
+			self._affinity[remote] = (index, self._affinity.get(remote, (index, 0))[1] + 1)
+			self._stats[index]['submitted'] += 1
+
+		return self._executors[index].submit(self._run, index, remote, method, args, kwargs)
+
+	def _run(self, index, remote, method, args, kwargs):
+		radio = self._radios[index]
+		try:
+			result, presses = remote._record_presses(method, *args, **kwargs)
+
+			for press in presses:
+				if press[0] == 'sleep':
+					remote._sleep(press[1])
+				else:
+					remote._transmit(radio, press[3], *press[1], **press[2])
+		finally:
+			with self._condition:
+				self._loads[index] -= 1
+				self._stats[index]['executed'] += 1
+
+				outstanding = self._affinity[remote][1] - 1
+				if outstanding == 0:
+					del self._affinity[remote]
+				else:
+					self._affinity[remote] = (index, outstanding)
+
+				self._condition.notify_all()
+
+		return result
+
+	def flush(self, timeout = None):
+		# Wait for every queued call to complete
+		with self._condition:
+			return self._condition.wait_for(lambda: sum(self._loads) == 0, timeout)
+
+	def close(self, wait = True):
+		with self._condition:
+			self._closed = True
+
+		for executor in self._executors:
+			executor.shutdown(wait = wait)
+
+		return None
+
+	def get_radios(self):
+		return list(self._radios)
+
+	def get_stats(self):
+		with self._condition:
+			stats = []
+			for index in range(len(self._radios)):
+				radio_stats = dict(self._stats[index])
+				radio_stats['pending'] = self._loads[index]
+				stats.append(radio_stats)
+
+			return stats
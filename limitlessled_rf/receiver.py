@@ -0,0 +1,139 @@
+#! /usr/bin/env python3
+
+import collections
+
+class Deduplicator:
+	# A bounded LRU of recently seen presses, so that the many copies
+	# of a single press are only reported once
+	def __init__(self, window, size = 256):
+		self._window = window
+		self._size = size
+		self._seen = collections.OrderedDict()
+		return None
+
+	def key(self, event):
+		# Protocols which are not understood are compared on their
+		# raw contents
+		if 'raw' in event:
+			return ('raw', tuple(event['raw']))
+
+		return (event.get('remote_id'), event.get('message_id'), event.get('button'), event.get('zone'))
+
+	def lookup(self, key, now):
+		event = self._seen.get(key)
+		if event is None:
+			return None
+
+		# Copies must arrive within the window to be the same press
+		if now - event['timestamp'] > self._window:
+			del self._seen[key]
+			return None
+
+		self._seen.move_to_end(key)
+		return event
+
+	def add(self, key, event):
+		self._seen[key] = event
+		while len(self._seen) > self._size:
+			self._seen.popitem(last = False)
+		return None
+
+class ButtonReceiver:
+	# Keep a radio listening for a remote's protocol, hopping between
+	# its channels, and report each logical press once along with the
+	# time it was first heard and how many copies were heard
+	def __init__(self, remote, window = None, dwell = 0.05, cache_size = 256):
+		config = remote._config
+
+		if window is None:
+			window = max(1.0, 2 * config['retries'] * config['delay'])
+
+		self._remote = remote
+		self._radio = remote._radio
+		self._channels = list(config['channels'])
+		self._syncword = config['syncword']
+		self._length = config.get('message_length', None)
+		self._format_config = config.get('format_config', None)
+		self._dwell = dwell
+		self._deduplicator = Deduplicator(window, cache_size)
+
+		self._radio.set_syncword(self._syncword, submit_queue = None)
+		self._channel_index = 0
+		self._radio.start_listening(self._channels[0])
+
+		return None
+
+	def _hop(self):
+		if len(self._channels) == 1:
+			return None
+
+		self._channel_index = (self._channel_index + 1) % len(self._channels)
+		self._radio.start_listening(self._channels[self._channel_index])
+
+		return None
+
+	def _handle(self, data, channel):
+		# Returns the event if this is the first copy of a press
+		if data is None:
+			return None
+
+		capture = self._remote._capture
+		if capture is not None:
+			capture.write('receive', self._remote.get_type(), self._syncword, [channel], 0, 0.0, data)
+
+		event = self._remote._decode_button_message(data)
+		if event is None:
+			return None
+
+		now = self._remote._time()
+		key = self._deduplicator.key(event)
+		existing_event = self._deduplicator.lookup(key, now)
+		if existing_event is not None:
+			existing_event['copies'] += 1
+			return None
+
+		event['timestamp'] = now
+		event['channel'] = channel
+		event['copies'] = 1
+		self._deduplicator.add(key, event)
+
+		return event
+
+	def events(self, timeout = None):
+		# Yield presses until "timeout" seconds have passed (forever if
+		# None); a timeout of 0 only returns what is already waiting.
+		# Events are yielded on their first copy, and the "copies" of
+		# an event keeps counting up as more copies are heard.
+		start_time = self._remote._time()
+		blocking = timeout is None or timeout > 0
+
+		while True:
+			channel = self._channels[self._channel_index]
+			dwell_start = self._remote._time()
+
+			while True:
+				now = self._remote._time()
+				if timeout is not None and now - start_time >= timeout:
+					blocking = False
+
+				remaining = self._dwell - (now - dwell_start)
+				if blocking and remaining <= 0:
+					break
+
+				# Nothing arriving within the rest of the dwell time ends
+				# the dwell on this channel
+				data = self._radio.receive(channel = channel, wait = blocking, wait_time = max(remaining, 0), length = self._length, format_config = self._format_config)
+				if data is None:
+					break
+
+				event = self._handle(data, channel)
+				if event is not None:
+					yield event
+
+			if timeout is not None and not blocking:
+				# Without blocking, make a single pass over the channels
+				if self._channel_index == len(self._channels) - 1:
+					self._hop()
+					return None
+
+			self._hop()
@@ -0,0 +1,123 @@
+#! /usr/bin/env python3
+
+import math
+
+class StaticRetryPolicy:
+	# Always use the configured number of retries
+	def get_retries(self, remote, message, retries, radio = None):
+		return retries
+
+class AdaptiveRetryPolicy:
+	# Learn how often a single copy of a frame is received on each
+	# channel, using a second radio listening for the frames this
+	# remote sends, and lower the number of retries to the fewest that
+	# still reach the target delivery probability.  Until enough has
+	# been observed (or with no listening radio) the configured number
+	# of retries is used.
+	def __init__(self, listen_radio = None, target_probability = 0.999, min_retries = 1, min_samples = 20, probe_interval = 10, listen_time = 0.05, decay = 0.98):
+		self._listen_radio = listen_radio
+		self._target_probability = target_probability
+		self._min_retries = min_retries
+		self._min_samples = min_samples
+		self._probe_interval = probe_interval
+		self._listen_time = listen_time
+		self._decay = decay
+
+		# (remote type, remote ID, channel) -> [successes, attempts, samples]
+		self._observations = {}
+
+		# (remote type, remote ID) -> number of presses
+		self._presses = {}
+
+		return None
+
+	def _remote_key(self, remote):
+		return (remote.get_type(), remote.get_id())
+
+	def record(self, remote, channel, success):
+		# Older observations count for less, so that the rate follows
+		# changes in reception
+		key = self._remote_key(remote) + (channel,)
+		observation = self._observations.setdefault(key, [0.0, 0.0, 0])
+		observation[0] = (observation[0] * self._decay) + (1 if success else 0)
+		observation[1] = (observation[1] * self._decay) + 1
+		observation[2] += 1
+
+		return None
+
+	def get_success_rate(self, remote, channel):
+		key = self._remote_key(remote) + (channel,)
+		observation = self._observations.get(key)
+		if observation is None or observation[2] < self._min_samples:
+			return None
+
+		return observation[0] / observation[1]
+
+	def _probe(self, remote, message, radio):
+		# Send a single copy of the frame on each channel and check
+		# whether the listening radio heard it
+		config = remote._config
+		length = config.get('message_length', None)
+		format_config = config.get('format_config', None)
+
+		self._listen_radio.set_syncword(config['syncword'], submit_queue = None)
+		for channel in config['channels']:
+			self._listen_radio.start_listening(channel)
+			radio.multi_transmit(message, [channel], 1, 0, syncword = config['syncword'], submit_queue = config['radio_queue'], format_config = format_config)
+
+			received = self._listen_radio.receive(channel = channel, wait = True, wait_time = self._listen_time, length = length, format_config = format_config)
+
+			# Protocols with a fixed length are received without what
+			# follows it (such as the trailer lyh_cct frames are sent with)
+			compare_length = len(message)
+			if length is not None:
+				compare_length = min(compare_length, length)
+
+			success = received is not None and list(received)[:compare_length] == list(message)[:compare_length]
+
+			self.record(remote, channel, success)
+
+		return None
+
+	def get_retries(self, remote, message, retries, radio = None):
+		# Probes are sent on the radio the press is about to be sent on
+		if radio is None:
+			radio = remote._radio
+
+		remote_key = self._remote_key(remote)
+		presses = self._presses.get(remote_key, 0)
+		self._presses[remote_key] = presses + 1
+
+		if self._listen_radio is not None:
+			sampled = True
+			for channel in remote._config['channels']:
+				if self.get_success_rate(remote, channel) is None:
+					sampled = False
+					break
+
+			if not sampled or (presses % self._probe_interval) == 0:
+				self._probe(remote, message, radio)
+
+		# Probability that every channel misses a single round of copies
+		miss_probability = 1.0
+		for channel in remote._config['channels']:
+			success_rate = self.get_success_rate(remote, channel)
+			if success_rate is None:
+				return retries
+
+			miss_probability *= 1.0 - success_rate
+
+		if miss_probability >= 1.0:
+			return retries
+
+		if miss_probability <= 0.0:
+			needed_retries = self._min_retries
+		else:
+			needed_retries = math.ceil(math.log(1.0 - self._target_probability) / math.log(miss_probability))
+
+		# Keep any extra effort asked for (e.g. "try_hard")
+		configured_retries = remote._config['retries']
+		if configured_retries > 0 and retries > configured_retries:
+			needed_retries = math.ceil(needed_retries * retries / configured_retries)
+
+		return max(self._min_retries, min(retries, int(needed_retries)))
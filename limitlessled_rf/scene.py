@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+
+import collections
+
+# Order in which the parts of a scene are applied to a remote
+_action_order = ['on', 'mode', 'temperature', 'brightness', 'off']
+
+def _is_grey(rgb):
+	r = (rgb >> 16) & 0xff
+	g = (rgb >>  8) & 0xff
+	b =  rgb        & 0xff
+
+	return r == g and g == b
+
+def _zone_actions(remote, target, zone):
+	actions = {}
+
+	if target.get('on', None) is True:
+		actions['on'] = True
+
+	if 'color' in target:
+		rgb = target['color']
+		if _is_grey(rgb):
+			# A shade of grey is really white at some brightness,
+			# unless a brightness was explicitly asked for
+			actions['mode'] = 'white'
+			if 'brightness' not in target:
+				actions['brightness'] = rgb & 0xff
+		else:
+			actions['mode'] = rgb
+
+	if 'temperature' in target:
+		actions['temperature'] = target['temperature']
+
+	if 'brightness' in target:
+		actions['brightness'] = target['brightness']
+
+	if target.get('on', None) is False:
+		actions['off'] = target.get('dim', True)
+
+	# Skip going to white when the bulbs are already white
+	if actions.get('mode', None) == 'white':
+		if 'is_white' in remote._config['features']:
+			del actions['mode']
+		else:
+			mode = remote._get_tracked_state('mode', zone)
+			if mode is not None and mode['value'] == 'white':
+				del actions['mode']
+
+	return actions
+
+def _group_zones(remote, zone_values):
+	# Use the all zones form for the most common value when every zone
+	# of the remote is being set, then override the zones which differ
+	zone_ids = remote.get_zone_ids()
+
+	if len(zone_values) == 0:
+		return []
+
+	if not all([zone_id in zone_values for zone_id in zone_ids]):
+		return sorted(zone_values.items())
+
+	counts = collections.Counter([zone_values[zone_id] for zone_id in zone_ids])
+	common_value, common_count = counts.most_common(1)[0]
+	if common_count < 2 and len(zone_ids) > 1:
+		return sorted(zone_values.items())
+
+	grouped = [(None, common_value)]
+	for zone, value in sorted(zone_values.items()):
+		if zone in zone_ids and value == common_value:
+			continue
+		grouped.append((zone, value))
+
+	return grouped
+
+def _plan_call(remote, action, zone, value):
+	if action == 'on':
+		return (remote, 'on', (zone,), {})
+	elif action == 'mode' and value == 'white':
+		return (remote, 'white', (zone,), {})
+	elif action == 'mode':
+		return (remote, 'set_color', (value, zone), {})
+	elif action == 'temperature':
+		return (remote, 'set_temperature', (value, zone), {})
+	elif action == 'brightness':
+		return (remote, 'set_brightness', (value, zone), {})
+	elif action == 'off':
+		return (remote, 'off', (zone,), {'dim': value})
+
+def _plan_remote(remote, zone_targets):
+	# Targets for all zones apply to every zone, unless a zone has its
+	# own target for the same attribute
+	all_zones_target = zone_targets.get(None, {})
+	zone_ids = list(remote.get_zone_ids())
+	for zone in zone_targets:
+		if zone is not None and zone not in zone_ids:
+			zone_ids.append(zone)
+
+	# Compute the per-zone actions
+	zone_actions = {}
+	for zone in zone_ids:
+		target = dict(all_zones_target)
+		target.update(zone_targets.get(zone, {}))
+		if len(target) == 0:
+			continue
+
+		zone_actions[zone] = _zone_actions(remote, target, zone)
+
+	# For each kind of action, combine zones where possible
+	plan = []
+	for action in _action_order:
+		zone_values = {}
+		for zone, actions in zone_actions.items():
+			if action in actions:
+				zone_values[zone] = actions[action]
+
+		for zone, value in _group_zones(remote, zone_values):
+			# A grouped white press may still be skippable
+			if action == 'mode' and value == 'white' and zone is None:
+				mode = remote._get_tracked_state('mode', None)
+				if mode is not None and mode['value'] == 'white':
+					continue
+
+			plan.append(_plan_call(remote, action, zone, value))
+
+	return plan
+
+def plan_scene(scene):
+	# Remotes sharing a syncword are planned next to each other, so
+	# that the radio does not need to keep switching between them
+	groups = collections.OrderedDict()
+	for remote, zone_targets in scene.items():
+		syncword = tuple(remote._config['syncword'])
+		groups.setdefault(syncword, []).append((remote, zone_targets))
+
+	plan = []
+	for syncword, remotes in groups.items():
+		for remote, zone_targets in remotes:
+			plan.extend(_plan_remote(remote, zone_targets))
+
+	return plan
+
+def apply_scene(scene):
+	result = True
+	for remote, method, args, kwargs in plan_scene(scene):
+		if not getattr(remote, method)(*args, **kwargs):
+			result = False
+
+	return result
@@ -0,0 +1,364 @@
+#! /usr/bin/env python3
+
+import concurrent.futures
+import copy
+import threading
+
+from . import mirror
+
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+class Job:
+	# A call to a Remote method, run by a Scheduler one press at a
+	# time so that it can be preempted, cancelled or retargeted
+	# between presses
+	def __init__(self, scheduler, priority, remote, method, args, kwargs):
+		self.priority = priority
+		self.remote = remote
+		self.method = method
+		self.future = concurrent.futures.Future()
+
+		self._scheduler = scheduler
+		self._args = args
+		self._kwargs = kwargs
+
+		# The presses planned for the current target, how many of them
+		# have been performed, and the remote's tracked state from
+		# before they were planned (None once rewound)
+		self._result = None
+		self._presses = None
+		self._index = 0
+		self._tracked_state = None
+
+		# Presses transmitted across every plan
+		self._sent = 0
+
+		self._state = 'pending'
+		self._cancel_requested = False
+		self._retarget = None
+
+		return None
+
+	def _plan(self):
+		self._tracked_state = copy.deepcopy(self.remote._tracked_state)
+		self._result, self._presses = self.remote._record_presses(self.method, *self._args, **self._kwargs)
+		self._index = 0
+		return None
+
+	def _rewind(self):
+		# Replace the tracked state the remote assumed when planning
+		# with what the presses performed so far really achieved --
+		# anything that cannot be known is forgotten
+		remote = self.remote
+		tracked_state = self._tracked_state
+		self._tracked_state = None
+
+		if tracked_state is None or not remote._config.get('track_state', False):
+			return None
+
+		if self._index == len(self._presses):
+			return None
+
+		# A mirror seeded with the state from before the presses were
+		# planned, and which does not age what it knows
+		state_mirror = mirror.StateMirror(remote.get_type(), [remote.get_id()], time_command = lambda: 0.0)
+		for zone in remote.get_zone_ids():
+			zone_state = state_mirror._get_zone_state(remote.get_id(), zone)
+			for attribute in ['brightness', 'temperature', 'mode']:
+				entry = tracked_state.get(attribute, {}).get(zone)
+				if entry is None:
+					entry = tracked_state.get(attribute, {}).get(None)
+				if entry is None:
+					continue
+
+				value = entry['value']
+				if attribute in state_mirror._stepped_attributes:
+					value = [value, value]
+
+				state_mirror._set(zone_state, attribute, value, 0.0)
+
+		for press in self._presses[0:self._index]:
+			if press[0] != 'transmit':
+				continue
+
+			event = remote._decode_button_message(press[1][0])
+			if event is not None:
+				state_mirror.consume(event, 0.0)
+
+		remote._tracked_state = tracked_state
+		for zone in remote.get_zone_ids():
+			state = state_mirror.get_state(remote.get_id(), zone)
+			for attribute in ['brightness', 'temperature', 'mode']:
+				value = state['values'][attribute]
+				if state['confidence'][attribute] < 1.0:
+					value = None
+
+				remote._set_tracked_state(attribute, zone, value)
+
+		return None
+
+	def cancel(self):
+		# Stop before the next press; a job which has already sent
+		# some of its presses completes with a result of False
+		return self._scheduler._cancel(self)
+
+	def retarget(self, *args, **kwargs):
+		# Continue towards a new target (the method's arguments) from
+		# wherever the presses sent so far got to
+		return self._scheduler._retarget_job(self, args, kwargs)
+
+	def get_progress(self):
+		with self._scheduler._condition:
+			if self._presses is None:
+				remaining = None
+			else:
+				remaining = len([press for press in self._presses[self._index:] if press[0] == 'transmit'])
+
+			return {
+				'state':     self._state,
+				'sent':      self._sent,
+				'remaining': remaining
+			}
+
+	def done(self):
+		return self.future.done()
+
+	def result(self, timeout = None):
+		return self.future.result(timeout)
+
+class Scheduler:
+	# Run calls to remotes sharing a radio on a worker thread, in order
+	# of priority.  Between any two presses of a job, a waiting job of
+	# a more urgent priority class is run first.
+	_method_priorities = {
+		'on':              PRIORITY_URGENT,
+		'off':             PRIORITY_URGENT,
+		'pair':            PRIORITY_URGENT,
+		'unpair':          PRIORITY_URGENT,
+		'set_brightness':  PRIORITY_NORMAL,
+		'set_color':       PRIORITY_NORMAL,
+		'set_temperature': PRIORITY_NORMAL,
+		'night':           PRIORITY_NORMAL,
+		'white':           PRIORITY_NORMAL,
+		'raw_send_button': PRIORITY_NORMAL,
+		'resync':          PRIORITY_BACKGROUND
+	}
+
+	def __init__(self, radio, start = True):
+		self._radio = radio
+		self._pending = []
+		self._current = None
+		self._closed = False
+		self._condition = threading.Condition()
+		self._stats = {
+			'submitted':  0,
+			'executed':   0,
+			'preempted':  0,
+			'cancelled':  0,
+			'retargeted': 0
+		}
+
+		self._thread = None
+		if start:
+			self.start()
+
+		return None
+
+	def start(self):
+		if self._thread is not None:
+			return False
+
+		self._thread = threading.Thread(target = self._run, name = 'limitlessled_rf-scheduler')
+		self._thread.daemon = True
+		self._thread.start()
+
+		return True
+
+	def submit(self, remote, method, *args, **kwargs):
+		priority = self._method_priorities.get(method, PRIORITY_NORMAL)
+		return self.submit_with_priority(priority, remote, method, *args, **kwargs)
+
+	def submit_with_priority(self, priority, remote, method, *args, **kwargs):
+		job = Job(self, priority, remote, method, args, kwargs)
+
+		with self._condition:
+			if self._closed:
+				raise RuntimeError('Scheduler is closed')
+
+			self._stats['submitted'] += 1
+			self._enqueue(job)
+			self._condition.notify_all()
+
+		return job
+
+	def _enqueue(self, job, resume = False):
+		# Jobs run in order within a priority class, except that a
+		# preempted job resumes ahead of the rest of its class
+		index = 0
+		for pending_job in self._pending:
+			if pending_job.priority > job.priority:
+				break
+			if resume and pending_job.priority == job.priority:
+				break
+			index += 1
+
+		self._pending.insert(index, job)
+		return None
+
+	def _cancel(self, job):
+		with self._condition:
+			if job.future.done():
+				return False
+
+			if job in self._pending and job._presses is None:
+				self._pending.remove(job)
+				job._state = 'cancelled'
+				job.future.cancel()
+				self._stats['cancelled'] += 1
+				self._condition.notify_all()
+				return True
+
+			job._cancel_requested = True
+			if job in self._pending:
+				self._pending.remove(job)
+				self._finish_cancelled(job)
+
+		return True
+
+	def _finish_cancelled(self, job):
+		job._rewind()
+		job._state = 'cancelled'
+		job.future.set_result(False)
+		self._stats['cancelled'] += 1
+		self._condition.notify_all()
+		return None
+
+	def _retarget_job(self, job, args, kwargs):
+		with self._condition:
+			if job.future.done() or job._cancel_requested:
+				return False
+
+			self._stats['retargeted'] += 1
+			if job._presses is None:
+				job._args = args
+				job._kwargs = kwargs
+				return True
+
+			job._retarget = (args, kwargs)
+
+		return True
+
+	def _should_yield(self, job):
+		# Urgent jobs are never preempted
+		if job.priority == PRIORITY_URGENT:
+			return False
+
+		return len(self._pending) != 0 and self._pending[0].priority < job.priority
+
+	def _run(self):
+		while True:
+			with self._condition:
+				while len(self._pending) == 0 and not self._closed:
+					self._condition.wait()
+
+				if len(self._pending) == 0:
+					return None
+
+				job = self._pending.pop(0)
+				self._current = job
+
+			if job._presses is None and not job.future.set_running_or_notify_cancel():
+				with self._condition:
+					self._current = None
+					self._condition.notify_all()
+				continue
+
+			try:
+				self._run_job(job)
+			except Exception as error:
+				with self._condition:
+					job._state = 'failed'
+					job.future.set_exception(error)
+
+			with self._condition:
+				self._current = None
+				self._condition.notify_all()
+
+	def _run_job(self, job):
+		with self._condition:
+			# Jobs paused part way through assumed they would reach their
+			# target, which no longer holds once another job plans
+			# against the same remote
+			for pending_job in self._pending:
+				if pending_job.remote is job.remote and pending_job._presses is not None:
+					pending_job._rewind()
+
+			if job._retarget is not None:
+				job._args, job._kwargs = job._retarget
+				job._retarget = None
+				job._rewind()
+
+			# A paused job continues with the rest of its presses, unless
+			# it was rewound -- then it plans again from where the
+			# presses sent so far got to
+			if job._presses is None or job._tracked_state is None:
+				job._plan()
+
+			job._state = 'running'
+
+		while True:
+			with self._condition:
+				if job._cancel_requested:
+					self._finish_cancelled(job)
+					return None
+
+				if job._retarget is not None:
+					job._args, job._kwargs = job._retarget
+					job._retarget = None
+					job._rewind()
+					job._plan()
+
+				if job._index == len(job._presses):
+					job._state = 'done'
+					job.future.set_result(job._result)
+					self._stats['executed'] += 1
+					return None
+
+				if self._should_yield(job):
+					job._state = 'paused'
+					self._stats['preempted'] += 1
+					self._enqueue(job, resume = True)
+					return None
+
+				press = job._presses[job._index]
+
+			if press[0] == 'sleep':
+				job.remote._sleep(press[1])
+			else:
+				job.remote._transmit(self._radio, press[3], *press[1], **press[2])
+
+			with self._condition:
+				job._index += 1
+				if press[0] == 'transmit':
+					job._sent += 1
+
+	def flush(self, timeout = None):
+		# Wait for every queued job to complete
+		with self._condition:
+			return self._condition.wait_for(lambda: len(self._pending) == 0 and self._current is None, timeout)
+
+	def close(self, wait = True):
+		with self._condition:
+			self._closed = True
+			self._condition.notify_all()
+
+		if wait and self._thread is not None:
+			self._thread.join()
+
+		return None
+
+	def get_stats(self):
+		with self._condition:
+			return dict(self._stats)
@@ -0,0 +1,260 @@
+#! /usr/bin/env python3
+
+import collections
+import random
+
+from . import Remote
+
+class SimulatedClock:
+	# A virtual clock, which only moves forward when something sleeps
+	def __init__(self, start = 0.0):
+		self._now = start
+		return None
+
+	def time(self):
+		return self._now
+
+	def sleep(self, seconds):
+		if seconds > 0:
+			self._now += seconds
+		return None
+
+class SimulatedEther:
+	# The medium shared by simulated radios and bulbs, which may lose
+	# any copy of a frame with a given probability
+	def __init__(self, clock = None, loss = 0.0, seed = None):
+		if clock is None:
+			clock = SimulatedClock()
+
+		self.clock = clock
+		self.loss = loss
+		self._random = random.Random(seed)
+		self._listeners = []
+
+		return None
+
+	def attach(self, listener):
+		self._listeners.append(listener)
+		return None
+
+	def detach(self, listener):
+		self._listeners.remove(listener)
+		return None
+
+	def transmit(self, sender, frame, channel, syncword):
+		for listener in self._listeners:
+			if listener is sender:
+				continue
+
+			if self.loss > 0 and self._random.random() < self.loss:
+				continue
+
+			listener.deliver(frame, channel, syncword)
+
+		return None
+
+class SimulatedRadio:
+	# An in-memory stand-in for an LT8900 radio, which accounts for the
+	# airtime of what it sends on a virtual clock instead of sleeping
+	def __init__(self, ether = None, clock = None, loss = 0.0, seed = None, frame_time = 0.0):
+		if ether is None:
+			ether = SimulatedEther(clock, loss, seed)
+
+		self.ether = ether
+		self.clock = ether.clock
+		self._frame_time = frame_time
+		self._syncword = None
+		self._channel = None
+		self._received = collections.deque()
+		self._stats = {
+			'presses': 0,
+			'frames':  0,
+			'airtime': 0.0
+		}
+
+		ether.attach(self)
+
+		return None
+
+	def remote_config(self):
+		# Config for a Remote so that it sleeps on the virtual clock
+		return {
+			'sleep_command': self.clock.sleep,
+			'time_command':  self.clock.time
+		}
+
+	def _transmit_frame(self, message, channel, syncword):
+		if syncword is None:
+			syncword = self._syncword
+
+		self.ether.transmit(self, list(message), channel, list(syncword))
+		self._stats['frames'] += 1
+		self._stats['airtime'] += self._frame_time
+		self.clock.sleep(self._frame_time)
+
+		return None
+
+	def transmit(self, message, channel, syncword = None, submit_queue = None, format_config = None):
+		self._transmit_frame(message, channel, syncword)
+		self._stats['presses'] += 1
+		return True
+
+	def multi_transmit(self, message, channels, retries, delay, syncword = None, submit_queue = None, format_config = None):
+		for retry in range(retries):
+			for channel in channels:
+				self._transmit_frame(message, channel, syncword)
+
+			self._stats['airtime'] += delay
+			self.clock.sleep(delay)
+
+		self._stats['presses'] += 1
+		return True
+
+	def set_syncword(self, syncword, submit_queue = None):
+		self._syncword = list(syncword)
+		return True
+
+	def start_listening(self, channel):
+		self._channel = channel
+		self._received.clear()
+		return True
+
+	def deliver(self, frame, channel, syncword):
+		if channel != self._channel or syncword != self._syncword:
+			return None
+
+		self._received.append(frame)
+		return None
+
+	def receive(self, channel = None, wait = False, wait_time = 0.1, length = None, format_config = None):
+		if channel is not None and channel != self._channel:
+			self.start_listening(channel)
+
+		if len(self._received) == 0 and wait:
+			self.clock.sleep(wait_time)
+
+		if len(self._received) == 0:
+			return None
+
+		frame = self._received.popleft()
+		if length is not None:
+			frame = frame[:length]
+
+		return frame
+
+	def get_stats(self):
+		return dict(self._stats)
+
+	def reset_stats(self):
+		for key in self._stats:
+			self._stats[key] = type(self._stats[key])()
+		return None
+
+class SimulatedBulb:
+	# A bulb paired to one zone of one remote, which decodes frames with
+	# the same code as Remote, ignores repeated copies of a press (by
+	# message ID) and tracks what state it would be in
+	def __init__(self, ether, remote_type, remote_id, zone):
+		if remote_type not in ['rgbw', 'cct']:
+			raise ValueError('Unsupported remote type: {}'.format(remote_type))
+
+		self._decoder = Remote(None, remote_type, remote_id)
+		self._config = self._decoder._config
+		self._type = remote_type
+		self._remote_id = remote_id
+		self._zone = zone
+		self._last_message_id = None
+
+		self.state = {
+			'on':          False,
+			'night':       False,
+			'mode':        'white',
+			'brightness':  self._config['brightness_range'][1],
+			'temperature': self._config.get('temperature_output_range', [0])[0],
+			'color':       0
+		}
+		self.presses = 0
+		self.duplicates = 0
+
+		ether.attach(self)
+
+		return None
+
+	def deliver(self, frame, channel, syncword):
+		if syncword != list(self._config['syncword']) or channel not in self._config['channels']:
+			return None
+
+		button_info = self._decoder._decode_button_message(frame)
+		if button_info is None or button_info.get('remote_id') != self._remote_id:
+			return None
+
+		# Every copy of a press carries the same message ID
+		if button_info['message_id'] == self._last_message_id:
+			self.duplicates += 1
+			return None
+		self._last_message_id = button_info['message_id']
+
+		# Set color is only addressed to a zone via the brightness byte
+		if self._type == 'rgbw' and button_info['button'] == 'zone_set_color':
+			zone = frame[4] & 0b111
+			if zone != 0:
+				button_info['zone'] = zone
+
+		zone = button_info.get('zone', None)
+		if zone is not None and zone != self._zone:
+			return None
+
+		self.presses += 1
+		self._apply(button_info)
+
+		return None
+
+	def _step(self, attribute, range_name, direction):
+		value_min, value_max = self._config[range_name]
+		value = self.state[attribute] + direction
+		self.state[attribute] = max(value_min, min(value_max, value))
+		return None
+
+	def _apply(self, button_info):
+		button = button_info['button']
+		if button.startswith('zone_'):
+			button = button[5:]
+
+		if button == 'on':
+			self.state['on'] = True
+			self.state['night'] = False
+			return None
+
+		if button == 'night':
+			self.state['on'] = True
+			self.state['night'] = True
+			self.state['brightness'] = self._config['brightness_range'][0]
+			return None
+
+		# Bulbs which are off ignore everything else
+		if not self.state['on']:
+			return None
+
+		if button == 'off':
+			self.state['on'] = False
+		elif button == 'max':
+			self.state['night'] = False
+			self.state['brightness'] = self._config['brightness_range'][1]
+		elif button == 'white':
+			self.state['mode'] = 'white'
+		elif button == 'set_brightness':
+			self.state['night'] = False
+			self.state['brightness'] = button_info['brightness']
+		elif button == 'set_color':
+			self.state['mode'] = 'color'
+			self.state['color'] = button_info['color']
+		elif button == 'brightness_up':
+			self._step('brightness', 'brightness_range', 1)
+		elif button == 'brightness_down':
+			self._step('brightness', 'brightness_range', -1)
+		elif button == 'temperature_up':
+			self._step('temperature', 'temperature_output_range', 1)
+		elif button == 'temperature_down':
+			self._step('temperature', 'temperature_output_range', -1)
+
+		return None
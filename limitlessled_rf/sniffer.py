@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+
+import time
+
+from . import Remote
+from . import receiver
+
+class Sniffer:
+	# Cycle a radio through the syncword and channels of every protocol,
+	# decoding whatever is heard and keeping an index of every remote
+	# seen -- to discover which remotes are in range
+	def __init__(self, radio, remote_types = None, dwell = 0.1, window = 1.0, time_command = None):
+		if remote_types is None:
+			remote_types = sorted(Remote._remote_type_parameters_map.keys())
+
+		if time_command is None:
+			time_command = time.monotonic
+
+		self._radio = radio
+		self._time = time_command
+		self._decoders = {}
+		self._deduplicators = {}
+		self._plan = []
+
+		for remote_type in remote_types:
+			decoder = Remote(None, remote_type, 0)
+			self._decoders[remote_type] = decoder
+			self._deduplicators[remote_type] = receiver.Deduplicator(window)
+
+			# The dwell time may be given per protocol
+			if isinstance(dwell, dict):
+				type_dwell = dwell.get(remote_type, 0.1)
+			else:
+				type_dwell = dwell
+
+			for channel in decoder._config['channels']:
+				self._plan.append((remote_type, channel, type_dwell))
+
+		self._remotes = {}
+
+		return None
+
+	def _index(self, remote_type, event, duplicate, now):
+		if 'remote_id' not in event:
+			return None
+
+		key = (remote_type, event['remote_id'])
+		entry = self._remotes.get(key)
+		if entry is None:
+			entry = {
+				'remote_type':     remote_type,
+				'remote_id':       event['remote_id'],
+				'zones':           set(),
+				'last_message_id': None,
+				'frames':          0,
+				'presses':         0,
+				'first_seen':      now,
+				'last_seen':       now
+			}
+			self._remotes[key] = entry
+
+		entry['frames'] += 1
+		entry['last_seen'] = now
+		if not duplicate:
+			entry['presses'] += 1
+			entry['last_message_id'] = event.get('message_id')
+			if 'zone' in event:
+				entry['zones'].add(event['zone'])
+
+		return None
+
+	def _listen(self, remote_type, channel, dwell):
+		# Listen on one channel for one protocol, yielding new presses
+		decoder = self._decoders[remote_type]
+		config = decoder._config
+		length = config.get('message_length', None)
+		format_config = config.get('format_config', None)
+		deduplicator = self._deduplicators[remote_type]
+
+		self._radio.set_syncword(config['syncword'], submit_queue = None)
+		self._radio.start_listening(channel)
+
+		dwell_start = self._time()
+		while True:
+			remaining = dwell - (self._time() - dwell_start)
+			if remaining <= 0:
+				return None
+
+			data = self._radio.receive(channel = channel, wait = True, wait_time = remaining, length = length, format_config = format_config)
+			if data is None:
+				return None
+
+			event = decoder._decode_button_message(data)
+			if event is None:
+				continue
+
+			now = self._time()
+			key = deduplicator.key(event)
+			existing_event = deduplicator.lookup(key, now)
+			if existing_event is not None:
+				existing_event['copies'] += 1
+				self._index(remote_type, existing_event, True, now)
+				continue
+
+			event['remote_type'] = remote_type
+			event['channel'] = channel
+			event['timestamp'] = now
+			event['copies'] = 1
+			deduplicator.add(key, event)
+			self._index(remote_type, event, False, now)
+
+			yield event
+
+	def events(self, duration = None):
+		# Yield each new press heard, cycling through every protocol and
+		# channel until "duration" seconds have passed (forever if None)
+		start_time = self._time()
+		while True:
+			for remote_type, channel, dwell in self._plan:
+				for event in self._listen(remote_type, channel, dwell):
+					yield event
+
+				if duration is not None and (self._time() - start_time) >= duration:
+					return None
+
+	def sniff(self, duration):
+		for event in self.events(duration):
+			pass
+
+		return self.get_remotes()
+
+	def get_remotes(self):
+		remotes = []
+		for key, entry in sorted(self._remotes.items()):
+			remote = dict(entry)
+			remote['zones'] = sorted(entry['zones'])
+
+			elapsed = entry['last_seen'] - entry['first_seen']
+			if elapsed > 0:
+				remote['frame_rate'] = entry['frames'] / elapsed
+			else:
+				remote['frame_rate'] = None
+
+			remotes.append(remote)
+
+		return remotes
@@ -0,0 +1,211 @@
+#! /usr/bin/env python3
+
+import mmap
+import os
+import struct
+import time
+
+class StateStore:
+	# A persistent store of each remote's last message ID and tracked
+	# state, one fixed-size record per (remote type, remote ID) in a
+	# memory-mapped file.  Updates are written in place into the
+	# mapping and flushed to disk at most every "flush_interval"
+	# seconds, so sending does not cost a file open or rewrite.
+	_magic = b'LLRFSTO1'
+	_header = struct.Struct('<8sII')
+
+	# Record: remote type, remote ID, in use, message ID, then for each
+	# attribute and zone slot (all zones, then zones 1 to 8) the value
+	# plus one (0 when unknown) and when it was last synced
+	#
+	# A record is in use once it has been allocated to a remote, and is
+	# marked as stored once something has been written to it
+	_record_free = 0
+	_record_stored = 1
+	_record_allocated = 2
+	_attributes = ['brightness', 'temperature', 'mode']
+	_zone_slots = 9
+	_key = struct.Struct('<8sIBB')
+	_entry = struct.Struct('<HI')
+	_mode_codes = {
+		'color': 1,
+		'white': 2
+	}
+	_mode_names = {code: name for name, code in _mode_codes.items()}
+
+	def __init__(self, path, capacity = 1024, flush_interval = 1.0, time_command = None):
+		if time_command is None:
+			time_command = time.monotonic
+
+		self._path = path
+		self._flush_interval = flush_interval
+		self._time = time_command
+		self._record_size = self._key.size + (len(self._attributes) * self._zone_slots * self._entry.size)
+
+		if not os.path.exists(path):
+			with open(path, 'wb') as store_file:
+				store_file.write(self._header.pack(self._magic, self._record_size, capacity))
+				store_file.truncate(self._header.size + (capacity * self._record_size))
+
+		self._file = open(path, 'r+b')
+		self._map = mmap.mmap(self._file.fileno(), 0)
+
+		magic, record_size, capacity = self._header.unpack_from(self._map, 0)
+		if magic != self._magic or record_size != self._record_size:
+			self._map.close()
+			self._file.close()
+			raise ValueError('Not a state store (or an incompatible one): {}'.format(path))
+
+		self._capacity = capacity
+
+		# Index the records in use, and find the first slot after them
+		self._slots = {}
+		self._next_slot = 0
+		for slot in range(capacity):
+			remote_type, remote_id, in_use, message_id = self._key.unpack_from(self._map, self._get_offset(slot))
+			if in_use != self._record_free:
+				self._slots[(remote_type.rstrip(b'\x00').decode('ascii'), remote_id)] = slot
+				self._next_slot = slot + 1
+
+		self._dirty = False
+		self._last_flush = self._time()
+
+		return None
+
+	def _get_offset(self, slot):
+		return self._header.size + (slot * self._record_size)
+
+	def _grow(self):
+		# Double the number of records
+		self._map.flush()
+		self._map.close()
+
+		capacity = self._capacity * 2
+		self._file.truncate(self._header.size + (capacity * self._record_size))
+		self._map = mmap.mmap(self._file.fileno(), 0)
+		self._header.pack_into(self._map, 0, self._magic, self._record_size, capacity)
+		self._capacity = capacity
+
+		return None
+
+	def _written(self):
+		self._dirty = True
+		if (self._time() - self._last_flush) >= self._flush_interval:
+			self.flush()
+
+		return None
+
+	def get_slot(self, remote_type, remote_id):
+		# Find (or allocate) the record for a remote
+		key = (remote_type, remote_id)
+		slot = self._slots.get(key)
+		if slot is not None:
+			return slot
+
+		slot = self._next_slot
+		if slot >= self._capacity:
+			self._grow()
+
+		# Mark the record in use straight away, so that it is not given
+		# to another remote after a restart
+		self._map[self._get_offset(slot):self._get_offset(slot + 1)] = bytes(self._record_size)
+		self._key.pack_into(self._map, self._get_offset(slot), remote_type.encode('ascii'), remote_id, self._record_allocated, 0)
+		self._slots[key] = slot
+		self._next_slot = slot + 1
+		self._written()
+
+		return slot
+
+	def load(self, slot):
+		# Returns the message ID and tracked state of a record, or None
+		# if nothing has been stored in it yet
+		offset = self._get_offset(slot)
+		remote_type, remote_id, in_use, message_id = self._key.unpack_from(self._map, offset)
+		if in_use != self._record_stored:
+			return None
+
+		tracked_state = {}
+		offset += self._key.size
+		for attribute in self._attributes:
+			values = {}
+			for zone_slot in range(self._zone_slots):
+				value, synced = self._entry.unpack_from(self._map, offset)
+				offset += self._entry.size
+				if value == 0:
+					continue
+
+				if attribute == 'mode':
+					value = self._mode_names[value]
+				else:
+					value = value - 1
+
+				zone = zone_slot
+				if zone_slot == 0:
+					zone = None
+
+				values[zone] = {
+					'value': value,
+					'synced': float(synced)
+				}
+
+			if len(values) != 0:
+				tracked_state[attribute] = values
+
+		return message_id, tracked_state
+
+	def set_message_id(self, slot, message_id):
+		# Mark the record as stored along with the message ID
+		offset = self._get_offset(slot) + self._key.size - 2
+		self._map[offset] = self._record_stored
+		self._map[offset + 1] = message_id
+		self._written()
+		return None
+
+	def set_tracked_values(self, slot, attribute, values):
+		# Replace the stored values of one attribute; values which
+		# cannot be represented are not stored
+		if attribute not in self._attributes:
+			return None
+
+		offset = self._get_offset(slot)
+		self._map[offset + self._key.size - 2] = self._record_stored
+
+		offset += self._key.size
+		offset += self._attributes.index(attribute) * self._zone_slots * self._entry.size
+
+		for zone_slot in range(self._zone_slots):
+			zone = zone_slot
+			if zone_slot == 0:
+				zone = None
+
+			value = 0
+			synced = 0
+			entry = values.get(zone)
+			if entry is not None:
+				value = entry['value']
+				synced = int(entry['synced'])
+				if attribute == 'mode':
+					value = self._mode_codes.get(value, 0)
+				elif isinstance(value, int) and value >= 0 and value < 0xffff:
+					value = value + 1
+				else:
+					value = 0
+
+			self._entry.pack_into(self._map, offset + (zone_slot * self._entry.size), value, synced)
+
+		self._written()
+		return None
+
+	def flush(self):
+		if self._dirty:
+			self._map.flush()
+			self._dirty = False
+		self._last_flush = self._time()
+		return None
+
+	def close(self):
+		if not self._map.closed:
+			self.flush()
+			self._map.close()
+		self._file.close()
+		return None
@@ -0,0 +1,60 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import limitlessled_rf
+import limitlessled_rf.simulator
+
+class LyhCctTests(unittest.TestCase):
+	def setUp(self):
+		self.radio = limitlessled_rf.simulator.SimulatedRadio()
+		self.remote = limitlessled_rf.Remote(self.radio, 'lyh_cct', 0x1234, config = self.radio.remote_config())
+
+	def _button_name(self, button, zone):
+		if zone is not None and button in ['on', 'off']:
+			return 'zone_' + button
+		return button
+
+	def test_captured_frames_reproduced(self):
+		for (button, zone), frames in limitlessled_rf.Remote._lyh_cct_frames.items():
+			for frame in frames:
+				event = self.remote._decode_button_message(bytearray(frame))
+				self.assertIsNotNone(event, frame.hex())
+				self.assertEqual(event['button'], self._button_name(button, zone))
+				self.assertEqual(event.get('zone'), zone)
+
+				message = self.remote._encode_button_message(limitlessled_rf.ButtonEvent(button = event['button'], zone = zone, remote_id = 0x1234, message_id = event['message_id']))
+				self.assertEqual(bytes(message[0:13]), frame)
+
+	def test_encode_decode_round_trip(self):
+		for button in limitlessled_rf.Remote._lyh_cct_button_codes:
+			for zone in [None] + list(self.remote.get_zone_ids()):
+				for message_id in range(256):
+					button_info = {'button': self._button_name(button, zone), 'remote_id': 0x1234, 'message_id': message_id}
+					if zone is not None:
+						button_info['zone'] = zone
+
+					message = self.remote._encode_button_message(limitlessled_rf.ButtonEvent.from_dict(button_info))
+					event = self.remote._decode_button_message(message)
+					self.assertEqual(event['button'], button_info['button'])
+					self.assertEqual(event.get('zone'), zone)
+					self.assertEqual(event['message_id'], message_id)
+
+	def test_unknown_buttons_not_encoded(self):
+		for button_info in [{'button': 'max'}, {'button': 'night'}, {'button': 'zone_on', 'zone': 4}]:
+			button_info.update({'remote_id': 0x1234, 'message_id': 1})
+			self.assertIsNone(self.remote._encode_button_message(limitlessled_rf.ButtonEvent.from_dict(button_info)))
+
+		self.assertFalse(self.remote.raw_send_button({'button': 'max'}))
+
+	def test_corrupted_frame_rejected(self):
+		frame = bytearray(limitlessled_rf.Remote._lyh_cct_frames[('on', None)][0])
+		frame[10] ^= 0x80
+		self.assertIsNone(self.remote._decode_button_message(frame))
+
+if __name__ == '__main__':
+	unittest.main()
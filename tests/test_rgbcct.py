@@ -0,0 +1,139 @@
+#! /usr/bin/env python3
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import limitlessled_rf
+import limitlessled_rf.simulator
+
+# The second generation (V2) encoder as given in the published
+# open-source descriptions of the RGB+CCT protocol, transcribed
+# separately from the library's so that the two can be compared
+_reference_offsets = [
+	[0x45, 0x1F, 0x14, 0x5C],
+	[0x2B, 0xC9, 0xE3, 0x11],
+	[0x6D, 0x5F, 0x8A, 0x2B],
+	[0xAF, 0x03, 0x1D, 0xF3],
+	[0x1A, 0xE2, 0xF0, 0xD1],
+	[0x04, 0xD8, 0x71, 0x42],
+	[0xAF, 0x04, 0xDD, 0x07],
+	[0x61, 0x13, 0x38, 0x64]
+]
+
+def _reference_xor_key(key):
+	shift = 0 if (key & 0x0F) < 0x04 else 1
+	x = (((key & 0xF0) >> 4) + shift + 6) % 8
+	msn = (((4 + x) ^ 1) & 0x0F) << 4
+	lsn = (((key & 0x0F) + 4) ^ 2) & 0x0F
+	return msn | lsn
+
+def _reference_offset(byte, key, jump_start):
+	offset = _reference_offsets[byte - 1][key % 4]
+	if jump_start > 0 and key >= jump_start and key < jump_start + 0x80:
+		offset += 0x80
+	return offset
+
+def _reference_encode_byte(byte, s1, xor_key, s2):
+	return ((((byte + s1) & 0xff) ^ xor_key) + s2) & 0xff
+
+def _reference_encode(packet):
+	packet = list(packet)
+	xor_key = _reference_xor_key(packet[0])
+
+	# The checksum starts from the key byte itself
+	checksum = packet[0]
+	for byte in range(1, 8):
+		checksum = (checksum + packet[byte]) & 0xff
+		packet[byte] = _reference_encode_byte(packet[byte], 0, xor_key, _reference_offset(byte, packet[0], 0x54))
+	packet[8] = _reference_encode_byte(checksum, 2, xor_key, _reference_offset(8, packet[0], 0))
+	return bytearray(packet)
+
+class RgbCctTests(unittest.TestCase):
+	def setUp(self):
+		self.radio = limitlessled_rf.simulator.SimulatedRadio()
+		self.remote = limitlessled_rf.Remote(self.radio, 'rgbcct', 0x1234, message_id = 0x56, config = self.radio.remote_config())
+
+	def _unscrambled(self, button_info):
+		message = self.remote._encode_button_message(limitlessled_rf.ButtonEvent.from_dict(button_info))
+		return limitlessled_rf._v2_unscramble(message)
+
+	def test_scramble_matches_reference_encoder(self):
+		generator = random.Random(0)
+		for key in range(256):
+			packet = [key] + [generator.randrange(256) for byte in range(7)] + [0]
+			self.assertEqual(limitlessled_rf._v2_scramble(packet), _reference_encode(packet))
+
+	def test_unscramble_reverses_reference_encoder(self):
+		generator = random.Random(1)
+		for key in range(256):
+			packet = [key] + [generator.randrange(256) for byte in range(7)]
+			checksum = sum(packet) & 0xff
+			self.assertEqual(limitlessled_rf._v2_unscramble(_reference_encode(packet + [0])), bytearray(packet + [checksum]))
+
+	def test_unscramble_rejects_bad_checksum(self):
+		message = _reference_encode([0x42, 0x20, 0x12, 0x34, 0x01, 0x01, 0x56, 0x01, 0x00])
+		message[8] = (message[8] + 1) & 0xff
+		self.assertIsNone(limitlessled_rf._v2_unscramble(message))
+
+	def test_packet_layout(self):
+		# Protocol byte, remote ID, command, argument, message ID and
+		# zone, each in its own byte
+		packet = self._unscrambled({'button': 'zone_set_brightness', 'zone': 2, 'brightness': 50, 'remote_id': 0x1234, 'message_id': 0x56})
+		self.assertEqual(list(packet[1:8]), [0x20, 0x12, 0x34, 0x04, 0x8F + 50, 0x56, 0x02])
+
+		packet = self._unscrambled({'button': 'zone_set_saturation', 'zone': 3, 'saturation': 40, 'remote_id': 0x1234, 'message_id': 0x57})
+		self.assertEqual(list(packet[4:8]), [0x04, 0x0D + 40, 0x57, 0x03])
+
+		packet = self._unscrambled({'button': 'set_color', 'color': 0x80, 'remote_id': 0x1234, 'message_id': 0x58})
+		self.assertEqual(list(packet[4:8]), [0x02, 0x80, 0x58, 0x00])
+
+	def test_encode_decode_round_trip(self):
+		buttons = [
+			('on', {}),
+			('off', {}),
+			('night', {}),
+			('set_color', {'color': 0x5F}),
+			('set_temperature', {'temperature': 0}),
+			('set_temperature', {'temperature': 100}),
+			('set_brightness', {'brightness': 0}),
+			('set_brightness', {'brightness': 100}),
+			('set_saturation', {'saturation': 0}),
+			('set_saturation', {'saturation': 100})
+		]
+
+		for zone in [None] + list(self.remote.get_zone_ids()):
+			for button, arguments in buttons:
+				button_info = {'button': button, 'remote_id': 0x1234, 'message_id': 0x56}
+				button_info.update(arguments)
+				if zone is not None:
+					button_info['button'] = 'zone_' + button
+					button_info['zone'] = zone
+
+				message = self.remote._encode_button_message(limitlessled_rf.ButtonEvent.from_dict(button_info))
+				event = self.remote._decode_button_message(message)
+				self.assertIsNotNone(event, button_info)
+				self.assertEqual(event.to_dict(), button_info)
+
+	def test_decodes_any_key(self):
+		# Real remotes vary the first byte; the encoder always uses 0
+		for key in range(256):
+			message = _reference_encode([key, 0x20, 0x12, 0x34, 0x04, 0x8F + 10, 0x56, 0x01, 0x00])
+			event = self.remote._decode_button_message(message)
+			self.assertEqual(event.to_dict(), {'button': 'zone_set_brightness', 'zone': 1, 'brightness': 10, 'remote_id': 0x1234, 'message_id': 0x56})
+
+	def test_other_protocol_ignored(self):
+		message = _reference_encode([0x00, 0x25, 0x12, 0x34, 0x01, 0x01, 0x56, 0x01, 0x00])
+		self.assertIsNone(self.remote._decode_button_message(message))
+
+	def test_fut089_not_accepted(self):
+		# The FUT089 remote has 8 zones and its own protocol byte, so it
+		# is not this protocol under another name
+		with self.assertRaises(KeyError):
+			limitlessled_rf.Remote._get_protocol('fut089')
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import limitlessled_rf.capture
+import limitlessled_rf.simulator
+
+def dump(records):
+	count = 0
+	for record in records:
+		print("{timestamp:.6f} {direction:<8} {protocol:<8} syncword={syncword_hex} channels={channels} retries={retries} delay={delay:.3f} {frame_hex}".format(
+			syncword_hex = ','.join(['{:04x}'.format(word) for word in record['syncword']]),
+			frame_hex = record['frame'].hex(),
+			**record
+		))
+		count += 1
+
+	return count
+
+def main():
+	parser = argparse.ArgumentParser(description = 'Show or replay a limitlessled_rf capture file')
+	parser.add_argument('capture', help = 'capture file written by limitlessled_rf.capture.CaptureWriter')
+	parser.add_argument('--replay', action = 'store_true', help = 'replay the transmitted frames through a simulated radio instead of showing them')
+	parser.add_argument('--timing', default = 'original', choices = ['original', 'compressed'], help = 'keep the gaps between presses, or send them back to back')
+	parser.add_argument('--speed', type = float, default = 1.0, help = 'divide the gaps between presses by this much')
+	parser.add_argument('--direction', default = None, choices = ['transmit', 'receive'], help = 'only frames sent, or received')
+	parser.add_argument('--protocol', default = None, help = 'only frames of this remote type')
+	parser.add_argument('--start', type = float, default = None, help = 'only frames at or after this timestamp')
+	parser.add_argument('--end', type = float, default = None, help = 'only frames before this timestamp')
+	parser.add_argument('--frame-time', type = float, default = 0.0, help = 'airtime of each simulated frame, in seconds')
+	args = parser.parse_args()
+
+	reader = limitlessled_rf.capture.CaptureReader(args.capture)
+
+	direction = args.direction
+	if args.replay and direction is None:
+		direction = 'transmit'
+
+	records = reader.records(direction = direction, protocol = args.protocol, start = args.start, end = args.end)
+
+	if not args.replay:
+		count = dump(records)
+		print("{} of {} records".format(count, len(reader)))
+		reader.close()
+		return 0
+
+	radio = limitlessled_rf.simulator.SimulatedRadio(frame_time = args.frame_time)
+	start_time = radio.clock.time()
+	stats = limitlessled_rf.capture.replay(records, radio, timing = args.timing, speed = args.speed, sleep_command = radio.clock.sleep)
+	reader.close()
+
+	radio_stats = radio.get_stats()
+	print("Replayed {} presses ({} frames) in {:.3f} s of simulated time, {:.3f} s of it airtime".format(stats['presses'], stats['frames'], radio.clock.time() - start_time, radio_stats['airtime']))
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
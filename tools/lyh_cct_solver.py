@@ -0,0 +1,268 @@
+#! /usr/bin/env python3
+
+import argparse
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import limitlessled_rf
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# Polynomials tried when NumPy is not available to try all of them
+common_polynomials = {
+	8:  [0x07, 0x1D, 0x2F, 0x31, 0x39, 0x49, 0x9B, 0xD5],
+	16: [0x1021, 0x8005, 0x0589, 0x3D65, 0x8BB7, 0xA097, 0xC867, 0x2F15, 0x6F63, 0x5935]
+}
+
+def load_frames(paths, length):
+	# The frames captured into the library, and any from files of hex
+	# frames (one per line, "#" starts a comment)
+	frames = []
+	for captured_frames in limitlessled_rf.Remote._lyh_cct_frames.values():
+		frames.extend(captured_frames)
+
+	for path in paths:
+		with open(path, 'r') as corpus_file:
+			for line in corpus_file:
+				line = line.split('#')[0].strip().replace(' ', '').replace(':', '')
+				if line == '':
+					continue
+				frames.append(bytes.fromhex(line))
+
+	return [frame[0:length] for frame in frames if len(frame) >= length]
+
+def reflect(value, width):
+	result = 0
+	for bit in range(width):
+		if value & (1 << bit):
+			result |= 1 << (width - 1 - bit)
+	return result
+
+def crc_registers(data, polynomials, width, reflect_input):
+	# The CRC registers (with no initial value or final XOR) after each
+	# byte of "data", for many polynomials at once
+	mask = (1 << width) - 1
+	top_bit = width - 1
+	if numpy is not None:
+		registers = numpy.zeros(len(polynomials), dtype = numpy.uint32)
+		polynomials = numpy.asarray(polynomials, dtype = numpy.uint32)
+	else:
+		registers = [0] * len(polynomials)
+
+	for byte in data:
+		if reflect_input:
+			byte = reflect(byte, 8)
+
+		for bit in range(7, -1, -1):
+			data_bit = (byte >> bit) & 1
+			if numpy is not None:
+				feedback = ((registers >> top_bit) & 1) ^ data_bit
+				registers = ((registers << 1) & mask) ^ (polynomials * feedback)
+			else:
+				registers = [((register << 1) & mask) ^ (polynomial if ((register >> top_bit) & 1) ^ data_bit else 0) for register, polynomial in zip(registers, polynomials)]
+
+		yield registers
+
+def find_initial_value(frames, polynomial, width, reflect_input, reflect_output, start, end, position, byteorder):
+	# With a fixed length the initial value and final XOR cannot be
+	# told apart, so find the initial value that works with no final XOR
+	for initial_value in range(1 << width):
+		matched = True
+		for frame in frames[0:2]:
+			register = initial_value
+			for byte in frame[start:end]:
+				if reflect_input:
+					byte = reflect(byte, 8)
+				register ^= byte << (width - 8)
+				for bit in range(8):
+					if register & (1 << (width - 1)):
+						register = ((register << 1) ^ polynomial) & ((1 << width) - 1)
+					else:
+						register = (register << 1) & ((1 << width) - 1)
+			if reflect_output:
+				register = reflect(register, width)
+			if register != int.from_bytes(frame[position:position + (width // 8)], byteorder):
+				matched = False
+				break
+		if matched:
+			return initial_value
+
+	return None
+
+def matching_polynomials(registers, checks, polynomials):
+	# A CRC is affine in its input, so a polynomial fits the corpus when
+	# the CRC register XOR the check value is the same for every frame,
+	# whatever the initial value and final XOR are
+	if numpy is not None:
+		constant = registers[0] ^ checks[0]
+		matches = numpy.ones(len(polynomials), dtype = bool)
+		for frame_registers, check in zip(registers[1:], checks[1:]):
+			matches &= (frame_registers ^ check) == constant
+		return [polynomials[index] for index in numpy.nonzero(matches)[0]]
+
+	matches = []
+	for index, polynomial in enumerate(polynomials):
+		constant = registers[0][index] ^ checks[0]
+		if all([(frame_registers[index] ^ check) == constant for frame_registers, check in zip(registers[1:], checks[1:])]):
+			matches.append(polynomial)
+
+	return matches
+
+def solve_crc(frames, widths):
+	# Try every range of bytes, followed directly by the check value
+	models = []
+	length = min([len(frame) for frame in frames])
+	for width in widths:
+		if numpy is not None:
+			polynomials = list(range(1, 1 << width))
+		else:
+			polynomials = common_polynomials[width]
+
+		check_size = width // 8
+		for start, reflect_input in itertools.product(range(length - check_size), [False, True]):
+			frame_registers = [crc_registers(frame[start:length - check_size], polynomials, width, reflect_input) for frame in frames]
+			for end in range(start + 1, length - check_size + 1):
+				registers = [next(registers) for registers in frame_registers]
+				for byteorder, reflect_output in itertools.product(['big', 'little'], [False, True]):
+					checks = []
+					for frame in frames:
+						check = int.from_bytes(frame[end:end + check_size], byteorder)
+						if reflect_output:
+							check = reflect(check, width)
+						checks.append(check)
+
+					# Check values which never change fit any polynomial
+					if len(set(checks)) == 1:
+						continue
+
+					for polynomial in matching_polynomials(registers, checks, polynomials):
+						models.append({
+							'width': width,
+							'polynomial': polynomial,
+							'reflect_input': reflect_input,
+							'reflect_output': reflect_output,
+							'start': start,
+							'end': end,
+							'position': end,
+							'byteorder': byteorder
+						})
+
+	return models
+
+def varying_bytes(frames, mask = 0xff):
+	# Bytes which are the same in every frame fit any relation, so they
+	# are left out of the search
+	return [index for index in range(min([len(frame) for frame in frames])) if len(set([frame[index] & mask for frame in frames])) > 1]
+
+def solve_sums(frames, position):
+	# Additive and XOR checks of a byte over any set of the bytes before it
+	checks = []
+	for mask in [0xff, 0x7f]:
+		candidates = [index for index in varying_bytes(frames, mask) if index < position]
+		if position not in varying_bytes(frames, mask):
+			continue
+
+		for subset_bits in range(1, 1 << len(candidates)):
+			subset = [index for bit, index in enumerate(candidates) if subset_bits & (1 << bit)]
+			for operation in ['sum', 'xor']:
+				constants = set()
+				for frame in frames:
+					value = 0
+					for index in subset:
+						if operation == 'sum':
+							value += frame[index] & mask
+						else:
+							value ^= frame[index] & mask
+					if operation == 'sum':
+						constants.add(((frame[position] & mask) - value) & mask)
+					else:
+						constants.add((frame[position] & mask) ^ value)
+				if len(constants) == 1:
+					checks.append((operation, mask, subset, constants.pop()))
+
+	return checks
+
+def solve_parity(frames, length):
+	# High bits which are the parity of the low 7 bits of other bytes
+	relations = []
+	candidates = varying_bytes(frames, 0x7f)
+	for position in range(length):
+		if len(set([frame[position] >> 7 for frame in frames])) == 1:
+			continue
+
+		for subset in itertools.chain(*[itertools.combinations(candidates, size) for size in range(1, 4)]):
+			if position in subset:
+				continue
+			values = set()
+			for frame in frames:
+				parity = 0
+				for index in subset:
+					parity ^= bin(frame[index] & 0x7f).count('1') & 1
+				values.add(((frame[position] >> 7) & 1) ^ parity)
+			if len(values) == 1:
+				relations.append((position, list(subset), values.pop()))
+
+	return relations
+
+def verify(frames):
+	# Each frame must have a valid CRC, and be rebuilt exactly by the
+	# library's encoder from the fields decoded from it
+	failures = 0
+	for frame in frames:
+		crc = limitlessled_rf._crc16_kermit(frame[0:11])
+		if frame[11] != (crc & 0xff) or frame[12] != (crc >> 8):
+			print("FAIL (CRC): {}".format(frame.hex()))
+			failures += 1
+			continue
+
+		if limitlessled_rf._lyh_cct_decode(frame) is None:
+			print("FAIL (encoding): {}".format(frame.hex()))
+			failures += 1
+
+	print("{} of {} frames have a valid CRC-16/KERMIT and are reproduced by the encoder".format(len(frames) - failures, len(frames)))
+	return failures
+
+def main():
+	parser = argparse.ArgumentParser(description = 'Find and verify the check bytes of captured lyh_cct frames')
+	parser.add_argument('corpus', nargs = '*', help = 'files of captured frames, one hex frame per line')
+	parser.add_argument('--verify', action = 'store_true', help = 'only verify the frames against the known CRC and encoder')
+	parser.add_argument('--length', type = int, default = 13, help = 'number of bytes of each frame to consider')
+	parser.add_argument('--width', type = int, action = 'append', choices = [8, 16], help = 'CRC widths to search (default: 16)')
+	args = parser.parse_args()
+
+	frames = load_frames(args.corpus, args.length)
+	if len(frames) < 2:
+		print("At least two frames are needed")
+		return 1
+
+	if args.verify:
+		if verify(frames) != 0:
+			return 1
+		return 0
+
+	widths = args.width
+	if widths is None:
+		widths = [16]
+
+	print("Searching {} frames{}".format(len(frames), '' if numpy is not None else ' (common polynomials only, install NumPy to search all)'))
+	for model in solve_crc(frames, widths):
+		initial_value = find_initial_value(frames, model['polynomial'], model['width'], model['reflect_input'], model['reflect_output'], model['start'], model['end'], model['position'], model['byteorder'])
+		print("CRC-{width} polynomial 0x{polynomial:x} over bytes {start} to {end_byte} in bytes {position}+ ({byteorder} endian), reflected input {reflect_input}, reflected output {reflect_output}, initial value {initial}".format(end_byte = model['end'] - 1, initial = 'unknown' if initial_value is None else hex(initial_value), **model))
+
+	for position in range(1, min(11, args.length)):
+		for operation, mask, subset, constant in solve_sums(frames, position):
+			print("Byte {} is the {} of bytes {} (masked with 0x{:02x}) plus 0x{:02x}".format(position, operation, subset, mask, constant))
+
+	for position, subset, constant in solve_parity(frames, min(11, args.length)):
+		print("Bit 7 of byte {} is the parity of bytes {} XOR {}".format(position, subset, constant))
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())